@@ -1,34 +1,79 @@
-# __init__.py - Complete timezone fix with UTC+8 support
+# __init__.py - Support chat plugin; timestamps go out as epoch ms and are formatted client-side
 import json
+import math
+import os
 import time
+import click
 from datetime import datetime, timezone, timedelta
 from urllib import request as _rq, parse as _parse
-from flask import Blueprint, request, jsonify, url_for, render_template, session
+from flask import Blueprint, Response, request, jsonify, render_template, session, current_app, stream_with_context
 
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+
+from CTFd.cache import cache
 from CTFd.models import db, Users
 from CTFd.utils.decorators import authed_only, admins_only
 from CTFd.plugins import register_plugin_assets_directory
-from CTFd.utils.user import get_current_user
+from CTFd.utils.user import get_current_user, is_admin
 
-from .models import SupportTicket, SupportMessage, UserNotification
+from .models import (
+    SupportTicket, SupportMessage, UserNotification, SupportTicketArchive, SupportMessageArchive,
+    AdminReadCursor, message_summary, to_epoch_ms, pack_rows,
+)
+from .bulk import STATUSES, ticket_criteria, set_status, delete_tickets, auto_close_stale_tickets, broadcast_batch
+from .retention import run_retention, get_archived_ticket
+from .search import ensure_search_index, search_messages
+from .export import iter_message_rows, ndjson_stream, csv_stream
+from .ratelimit import RateLimiter
+from .schema import ensure_schema
+from .upsert import insert_ignore, upsert
+from .bundle import build_bundle, load_bundle
+from .binds import configure_chat_bind
+from .storage import message_fields, full_text, too_long, max_message_bytes
+from .querybudget import BROADCAST_BATCH_BUDGET, init_query_budget, query_budget
+from .stats import UNREAD_BY_ADMIN, bump, record_messages, ensure_counters, rebuild_counters, snapshot
 
 bp = Blueprint("support_chat", __name__, template_folder="templates")
 
-# Timezone configuration - UTC+8 (Singapore/Malaysia time)
-DISPLAY_TIMEZONE = timezone(timedelta(hours=8))
+try:
+    import orjson as _fast_json
+except ImportError:
+    _fast_json = None
+
+# Display timezone (IANA name) handed to the JS widgets; override with SUPPORT_CHAT_DISPLAY_TIMEZONE
+DEFAULT_DISPLAY_TIMEZONE = "Asia/Singapore"  # UTC+8
+
+def _setting(name, default):
+    """Plugin settings are read from CTFd's config as SUPPORT_CHAT_<NAME>"""
+    return current_app.config.get(f"SUPPORT_CHAT_{name}", default)
 
-def format_datetime_for_display(dt):
-    """Convert UTC datetime to UTC+8 for display"""
-    if not dt:
+def _display_timezone_name():
+    return _setting("DISPLAY_TIMEZONE", DEFAULT_DISPLAY_TIMEZONE)
+
+def _zone(name):
+    """tzinfo for an IANA zone name, or None if it cannot be resolved here"""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception:
         return None
-    
-    # If dt is naive, assume it's UTC
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    
-    # Convert to UTC+8
-    local_dt = dt.astimezone(DISPLAY_TIMEZONE)
-    return local_dt
+
+def _display_tz():
+    # load() swaps an unknown zone for UTC, so server and browser always agree
+    return _zone(_display_timezone_name()) or timezone.utc
+
+def _json(payload, status=200):
+    """jsonify(), through orjson when it is installed - used on the polling paths"""
+    if _fast_json is None:
+        return jsonify(payload), status
+    return Response(_fast_json.dumps(payload), status=status, mimetype="application/json")
+
+def _message_list(dicts):
+    """Messages as a plain list, or column arrays when the client asks with ?compact=1"""
+    if request.args.get("compact") == "1":
+        return pack_rows(dicts)
+    return dicts
 
 _last_translate = 0.0
 def _throttle(min_interval=0.75):
@@ -45,27 +90,114 @@ def support_nonce():
 
 # ---------- helpers ----------
 def _get_open_ticket_for_user(user_id: int):
-    return SupportTicket.query.filter_by(user_id=user_id, status="open").order_by(SupportTicket.id.desc()).first()
+    return SupportTicket.query.filter_by(open_user_id=user_id).first()
 
-def _create_open_ticket(user_id: int):
-    t = SupportTicket(user_id=user_id, status="open")
-    db.session.add(t)
-    db.session.commit()
-    return t
+def _lookup_users(user_ids):
+    """({id: user}, {team_id: team}) in two queries.
 
-def _get_or_create_open_ticket(user_id: int):
-    """Get existing open ticket or create a new one"""
-    # Try to get existing open ticket first
-    ticket = SupportTicket.query.filter_by(user_id=user_id, status="open").first()
-    
-    if ticket:
-        return ticket, False  # existing ticket, not created
+    The chat tables may live in their own database, so users and teams are
+    never joined in; they are fetched by id for a whole page at once.
+    """
+    user_ids = {uid for uid in user_ids if uid}
+    users = {u.id: u for u in Users.query.filter(Users.id.in_(user_ids)).all()} if user_ids else {}
+    team_ids = {u.team_id for u in users.values() if getattr(u, "team_id", None)}
+    teams = {}
+    if team_ids:
+        from CTFd.models import Teams
+        teams = {t.id: t for t in Teams.query.filter(Teams.id.in_(team_ids)).all()}
+    return users, teams
+
+def _note_message(ticket, message):
+    """Fold a flushed message into the ticket's summary columns"""
+    for key, value in message_summary(message).items():
+        setattr(ticket, key, value)
+
+def _mark_read(admin_id, ticket):
+    """Move the admin's read cursor to the end of the thread (no commit)"""
+    now = datetime.utcnow()
+    read = {
+        "last_read_message_id": ticket.last_message_id or 0,
+        "read_user_messages": ticket.user_message_count,
+        "updated": now,
+    }
+    db.session.execute(upsert(
+        AdminReadCursor, {"admin_id": admin_id, "ticket_id": ticket.id, **read},
+        ["admin_id", "ticket_id"], read,
+    ))
+
+def _open_ticket_id(user_id: int, now):
+    """Id of the user's open ticket, inserting one if needed - race-free, no commit.
+
+    The unique open_user_id guard makes the INSERT a no-op when a concurrent
+    request created the ticket first, so both end up on the same ticket. Call
+    it first in the transaction: if that ticket is gone again by the time we
+    look (closed in between), it rolls back and tries once more.
+    Returns (ticket_id, created); ticket_id is None only if the retry failed too.
+    """
+    for _attempt in range(2):
+        ticket_id = db.session.query(SupportTicket.id).filter(SupportTicket.open_user_id == user_id).scalar()
+        if ticket_id:
+            return ticket_id, False
+        
+        result = db.session.execute(insert_ignore(SupportTicket, {
+            "user_id": user_id,
+            "open_user_id": user_id,
+            "status": "open",
+            "created": now,
+            "updated": now,
+        }, ["open_user_id"]))
+        # Locking read: under MySQL's REPEATABLE READ a plain SELECT still sees the
+        # snapshot from before a concurrent winner committed its ticket
+        ticket_id = (db.session.query(SupportTicket.id)
+                     .filter(SupportTicket.open_user_id == user_id)
+                     .with_for_update().scalar())
+        if ticket_id:
+            return ticket_id, result.rowcount == 1
+        db.session.rollback()
+    return None, False
+
+# -------------------- FLOOD CONTROL --------------------
+_limiter = None  # RateLimiter, created in load()
+
+def _rate_limited(scope, user_id, burst, per_minute):
+    """Take a token from the user's bucket; return a 429 response if it is empty"""
+    if _limiter is None:
+        return None
+    allowed, retry_after = _limiter.hit(scope, user_id, int(burst), float(per_minute))
+    if allowed:
+        return None
     
-    # Create new ticket
-    ticket = SupportTicket(user_id=user_id, status="open")
-    db.session.add(ticket)
-    db.session.flush()  # Get the ID immediately
-    return ticket, True  # new ticket, created
+    retry = max(1, math.ceil(retry_after))
+    response = jsonify({
+        "ok": False,
+        "error": f"You're sending too fast. Try again in {retry}s.",
+        "retry_after": retry
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry)
+    return response
+
+def _recent_duplicate(ticket_id, user_id, text):
+    """The user's last message on the ticket if it has the same text and was just sent"""
+    window = float(_setting("DUPLICATE_WINDOW_SECONDS", 10))
+    last = (SupportMessage.query
+            .filter_by(ticket_id=ticket_id, sender_role="user", sender_id=user_id)
+            .order_by(SupportMessage.id.desc()).first())
+    if not last or (datetime.utcnow() - last.created).total_seconds() >= window:
+        return None
+    # Preview and length rule out almost every non-duplicate without loading
+    # the deferred body; only a compressed message that still matches needs it
+    if not last.full_length:
+        return last if last.text == text else None
+    if last.full_length != len(text) or not text.startswith(last.text):
+        return None
+    if full_text(last.text, last.body) == text:
+        return last
+    return None
+
+def _too_long_response():
+    limit = max_message_bytes()
+    return jsonify({"ok": False, "error": f"Message too long (max {limit // 1024} KB)", "max_bytes": limit}), 413
 
 # -------------------- USER --------------------
 @bp.route("/support/ticket", methods=["GET"])
@@ -77,16 +209,22 @@ def get_or_create_ticket():
     
     if not t:
         # Don't create ticket yet - just return empty state
-        return jsonify({
+        return _json({
             "ticket_id": None,
             "status": None,
-            "messages": [],
+            "messages": _message_list([]),
             "unread_admin_count": 0
         })
     
     # User has existing ticket - show messages and notifications
     msgs = (SupportMessage.query.filter_by(ticket_id=t.id)
             .order_by(SupportMessage.created.asc()).all())
+    # Serialize before the commit below expires the rows (one reload per message)
+    payload = {
+        "ticket_id": t.id,
+        "status": t.status,
+        "messages": _message_list([m.to_dict() for m in msgs]),
+    }
     
     # Get or create notification record
     notification = UserNotification.query.filter_by(
@@ -102,28 +240,15 @@ def get_or_create_ticket():
             unread_admin_count=0
         )
         db.session.add(notification)
-        db.session.commit()
     
-    # Calculate unread admin messages
-    unread_admin_messages = 0
-    if msgs:
-        last_seen_id = notification.last_seen_message_id
-        unread_admin_messages = SupportMessage.query.filter(
-            SupportMessage.ticket_id == t.id,
-            SupportMessage.sender_role == "admin",
-            SupportMessage.id > last_seen_id
-        ).count()
-        
-        # Update the notification record with current count
-        notification.unread_admin_count = unread_admin_messages
-        db.session.commit()
+    # Unread admin messages, counted from the thread already loaded
+    last_seen_id = notification.last_seen_message_id or 0
+    unread_admin_messages = sum(1 for m in msgs if m.sender_role == "admin" and m.id > last_seen_id)
+    notification.unread_admin_count = unread_admin_messages
+    db.session.commit()
     
-    return jsonify({
-        "ticket_id": t.id,
-        "status": t.status,
-        "messages": [m.to_dict() for m in msgs],
-        "unread_admin_count": unread_admin_messages
-    })
+    payload["unread_admin_count"] = unread_admin_messages
+    return _json(payload)
 
 @bp.route("/support/message", methods=["POST"])
 @authed_only
@@ -133,40 +258,75 @@ def post_user_message():
     text = (request.values.get("text") or "").strip()
     if not text:
         return jsonify({"ok": False, "error": "Empty message"}), 400
+    if too_long(text):
+        return _too_long_response()
+    
+    limited = _rate_limited("message", u.id,
+                            _setting("MESSAGE_BURST", 5), _setting("MESSAGES_PER_MINUTE", 20))
+    if limited:
+        return limited
 
-    # Get existing ticket OR create new one when user sends first message
-    t = _get_open_ticket_for_user(u.id)
-    if not t:
-        # Create ticket only when user actually sends a message
-        t = _create_open_ticket(u.id)
-        print(f"[TICKET] Created new ticket #{t.id} for user {u.name} ({u.id})")
+    # Everything below is one transaction: ticket upsert, message, notification
+    now = datetime.utcnow()
+    ticket_id, created = _open_ticket_id(u.id, now)
+    if ticket_id is None:
+        return jsonify({"ok": False, "error": "Could not open a ticket, please try again"}), 409
+    if created:
+        print(f"[TICKET] Created new ticket #{ticket_id} for user {u.name} ({u.id})")
+    else:
+        # Merge rapid re-sends of the same text (double-click, mashing Enter)
+        duplicate = _recent_duplicate(ticket_id, u.id, text)
+        if duplicate:
+            return jsonify({"ok": True, "message": duplicate.to_dict(), "duplicate": True})
+    SupportTicket.query.filter_by(id=ticket_id).update({
+        "updated": now,
+        "pending_user_messages": SupportTicket.pending_user_messages + 1,
+        "first_user_message_at": db.func.coalesce(SupportTicket.first_user_message_at, now),
+    }, synchronize_session=False)
 
-    m = SupportMessage(ticket_id=t.id, sender_role="user", sender_id=u.id, text=text)
-    t.updated = datetime.utcnow()
+    m = SupportMessage(ticket_id=ticket_id, sender_role="user", sender_id=u.id, created=now, **message_fields(text))
     db.session.add(m)
     db.session.flush()  # Get the message ID
+    # The UPDATE above already holds the ticket row, so summaries land in message order
+    SupportTicket.query.filter_by(id=ticket_id).update(message_summary(m), synchronize_session=False)
     
     # Update user's last seen message (user sees their own message immediately)
-    notification = UserNotification.query.filter_by(
-        user_id=u.id, 
-        ticket_id=t.id
-    ).first()
-    
-    if notification:
-        notification.last_seen_message_id = m.id
-        notification.updated = datetime.utcnow()
-    else:
-        notification = UserNotification(
-            user_id=u.id,
-            ticket_id=t.id,
-            last_seen_message_id=m.id,
-            unread_admin_count=0
-        )
-        db.session.add(notification)
-    
+    db.session.execute(upsert(UserNotification, {
+        "user_id": u.id,
+        "ticket_id": ticket_id,
+        "last_seen_message_id": m.id,
+        "unread_admin_count": 0,
+        "created": now,
+        "updated": now,
+    }, ["user_id", "ticket_id"], {"last_seen_message_id": m.id, "updated": now}))
+    
+    # Shared counter rows last, like every write path (see stats.bump)
+    bump({"tickets_open": 1 if created else 0, UNREAD_BY_ADMIN: 1})
+    record_messages("user", when=now)
     db.session.commit()
     return jsonify({"ok": True, "message": m.to_dict()})
 
+@bp.route("/support/message/<int:message_id>/full", methods=["GET"])
+@authed_only
+def get_full_message(message_id):
+    """Whole text of a message whose poll payload only carried a preview"""
+    u = get_current_user()
+    row = (db.session.query(SupportMessage, SupportTicket.user_id)
+           .join(SupportTicket, SupportTicket.id == SupportMessage.ticket_id)
+           .options(undefer(SupportMessage.body))
+           .filter(SupportMessage.id == message_id).first())
+    if row:
+        m, owner_id = row
+    else:
+        # Retained threads keep their bodies in the archive
+        m = (SupportMessageArchive.query.options(undefer(SupportMessageArchive.body))
+             .filter_by(id=message_id).order_by(SupportMessageArchive.archived.desc()).first())
+        owner_id = None
+    # Players may only read their own tickets; archived threads are admin-only
+    if not m or (not is_admin() and owner_id != u.id):
+        return jsonify({"ok": False, "error": "Message not found"}), 404
+    return _json({"ok": True, "id": m.id, "text": full_text(m.text, m.body)})
+
 @bp.route("/support/mark_read", methods=["POST"])
 @authed_only
 def mark_messages_read():
@@ -223,7 +383,7 @@ def get_unread_count():
     
     if not t:
         # No ticket exists - no unread messages
-        return jsonify({"unread_count": 0})
+        return _json({"unread_count": 0})
     
     notification = UserNotification.query.filter_by(
         user_id=u.id, 
@@ -259,138 +419,125 @@ def get_unread_count():
         notification.unread_admin_count = unread_count
         db.session.commit()
     
-    return jsonify({"unread_count": unread_count})
+    return _json({"unread_count": unread_count})
 
 # -------------------- ADMIN --------------------
 @bp.route("/support/admin", methods=["GET"])
 @admins_only
 def support_admin_home():
-    # Get tickets with better user lookup
-    tickets = SupportTicket.query.order_by(SupportTicket.updated.desc()).all()
+    _maybe_auto_close()
     
-    # Add user and team info to each ticket with better error handling
+    # Tickets with this admin's read cursor; the unread badge is a subtraction of maintained counts
+    admin = get_current_user()
+    rows = (
+        db.session.query(SupportTicket, AdminReadCursor.read_user_messages)
+        .outerjoin(AdminReadCursor, db.and_(
+            AdminReadCursor.ticket_id == SupportTicket.id,
+            AdminReadCursor.admin_id == admin.id,
+        ))
+        .order_by(SupportTicket.updated.desc())
+        .all()
+    )
+    tickets = []
+    for ticket, read_user_messages in rows:
+        ticket.unread_user_messages = max(0, ticket.user_message_count - (read_user_messages or 0))
+        tickets.append(ticket)
+    
+    # Owners and their teams for the whole list in two queries
+    users, teams = _lookup_users(t.user_id for t in tickets)
     for ticket in tickets:
-        if ticket.user_id:
-            try:
-                user = Users.query.get(ticket.user_id)
-                if user:
-                    # Try to get team info
-                    try:
-                        from CTFd.models import Teams
-                        if hasattr(user, 'team_id') and user.team_id:
-                            team = Teams.query.get(user.team_id)
-                            user.team = team
-                        else:
-                            user.team = None
-                    except Exception as e:
-                        print(f"[DEBUG] Team lookup failed: {e}")
-                        user.team = None
-                    
-                    ticket.user = user
-                else:
-                    print(f"[WARNING] User {ticket.user_id} not found for ticket {ticket.id}")
-                    ticket.user = None
-            except Exception as e:
-                print(f"[ERROR] User lookup failed for ticket {ticket.id}: {e}")
-                ticket.user = None
-        else:
-            ticket.user = None
-        
-        # Calculate unread user messages for this ticket (for admin)
-        if ticket.user_id:
-            notification = UserNotification.query.filter_by(
-                user_id=ticket.user_id, 
-                ticket_id=ticket.id
-            ).first()
-            
-            if notification:
-                # Messages from user that came after the user's last seen message
-                # This represents messages the admin might not have seen yet
-                ticket.unread_user_messages = SupportMessage.query.filter(
-                    SupportMessage.ticket_id == ticket.id,
-                    SupportMessage.sender_role == "user",
-                    SupportMessage.id > notification.last_seen_message_id
-                ).count()
-            else:
-                # If no notification record, count all recent user messages as potentially unread
-                ticket.unread_user_messages = SupportMessage.query.filter(
-                    SupportMessage.ticket_id == ticket.id,
-                    SupportMessage.sender_role == "user"
-                ).count()
-        else:
-            ticket.unread_user_messages = 0
+        ticket.user = users.get(ticket.user_id)
+        if ticket.user:
+            ticket.user.team = teams.get(getattr(ticket.user, "team_id", None))
     
-    # Convert ticket timestamps to UTC+8 for consistent display
+    # Epoch ms for the template; the browser formats them in the display timezone
     for ticket in tickets:
-        if ticket.updated:
-            ticket.updated = format_datetime_for_display(ticket.updated)
-        if ticket.created:
-            ticket.created = format_datetime_for_display(ticket.created)
+        ticket.updated_ms = to_epoch_ms(ticket.updated)
+        ticket.created_ms = to_epoch_ms(ticket.created)
     
     return render_template("support_admin.html", tickets=tickets)
 
 @bp.route("/support/admin/ticket/<int:ticket_id>", methods=["GET"])
 @admins_only
 def support_admin_ticket(ticket_id):
-    t = SupportTicket.query.get_or_404(ticket_id)
-    msgs = (SupportMessage.query.filter_by(ticket_id=ticket_id)
-            .order_by(SupportMessage.created.asc()).all())
-    user = Users.query.get(t.user_id) if t.user_id else None
+    t = SupportTicket.query.get(ticket_id)
+    if t:
+        key = _ticket_cache_key(t)
+        detail = _cache_get(key)
+        if detail is None:
+            msgs = (SupportMessage.query.filter_by(ticket_id=ticket_id)
+                    .order_by(SupportMessage.created.asc()).all())
+            detail = _ticket_detail(t, msgs)
+            _cache_set(key, detail, int(_setting("TICKET_CACHE_SECONDS", 300)))
+        # Opening the thread is what clears this admin's inbox badge
+        _mark_read(get_current_user().id, t)
+        db.session.commit()
+        return _json({"ticket": detail})
+    
+    # Fall back to the archive so retained threads stay readable
+    t, msgs = get_archived_ticket(ticket_id)
+    if not t:
+        return jsonify({"ok": False, "error": "Ticket not found"}), 404
+    return _json({"ticket": _ticket_detail(t, msgs, archived=True)})
+
+def _ticket_cache_key(t):
+    """Versioned by the ticket's own summary columns: any new message, deleted
+    message or status change yields a new key, so writes never have to purge.
+    Owner and creation time are part of it because SQLite reuses the rowids of
+    deleted tickets, and a fresh ticket can start with the same summary."""
+    compact = "c" if request.args.get("compact") == "1" else "f"
+    return (f"support_chat:ticket:{t.id}:{t.user_id}:{to_epoch_ms(t.created)}:"
+            f"{t.last_message_id or 0}:{t.message_count}:{t.status}:{compact}")
+
+def _cache_get(key):
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"[CACHE] get failed: {e}")
+        return None
+
+def _cache_set(key, value, timeout):
+    try:
+        cache.set(key, value, timeout=timeout)
+    except Exception as e:
+        print(f"[CACHE] set failed: {e}")
+
+def _ticket_detail(t, msgs, archived=False):
+    """Serialize a live or archived ticket for the admin thread view"""
+    # Owner and every sender resolved in bulk, not per message
+    users, teams = _lookup_users({t.user_id} | {m.sender_id for m in msgs})
+    
+    user = users.get(t.user_id)
     user_data = None
     if user:
-        # Get team information
-        team = None
-        team_name = None
-        if hasattr(user, 'team_id') and user.team_id:
-            try:
-                from CTFd.models import Teams
-                team = Teams.query.get(user.team_id)
-                team_name = team.name if team else None
-            except:
-                pass
-        
+        team = teams.get(getattr(user, "team_id", None))
         user_data = {
             "id": user.id, 
             "name": user.name, 
             "email": user.email,
-            "team_name": team_name
+            "team_name": team.name if team else None
         }
     
-    # Also get team info for message senders
     messages_with_team = []
     for m in msgs:
         msg_dict = m.to_dict()
-        if m.sender_id:
-            sender = Users.query.get(m.sender_id)
-            if sender and hasattr(sender, 'team_id') and sender.team_id:
-                try:
-                    from CTFd.models import Teams
-                    sender_team = Teams.query.get(sender.team_id)
-                    msg_dict['sender_name'] = sender.name
-                    msg_dict['sender_team'] = sender_team.name if sender_team else None
-                except:
-                    msg_dict['sender_name'] = sender.name
-                    msg_dict['sender_team'] = None
-            elif sender:
-                msg_dict['sender_name'] = sender.name
-                msg_dict['sender_team'] = None
+        sender = users.get(m.sender_id)
+        if sender:
+            sender_team = teams.get(getattr(sender, "team_id", None))
+            msg_dict['sender_name'] = sender.name
+            msg_dict['sender_team'] = sender_team.name if sender_team else None
         messages_with_team.append(msg_dict)
     
-    # Format timestamps for UTC+8 display
-    created_display = format_datetime_for_display(t.created)
-    updated_display = format_datetime_for_display(t.updated)
-    
-    return jsonify({
-        "ticket": {
-            "id": t.id,
-            "user_id": t.user_id,
-            "user": user_data,
-            "status": t.status,
-            "created": created_display.isoformat() if created_display else None,
-            "updated": updated_display.isoformat() if updated_display else None,
-            "messages": messages_with_team
-        }
-    })
+    return {
+        "id": t.id,
+        "user_id": t.user_id,
+        "user": user_data,
+        "status": t.status,
+        "archived": archived,
+        "created": to_epoch_ms(t.created),
+        "updated": to_epoch_ms(t.updated),
+        "messages": _message_list(messages_with_team)
+    }
 
 @bp.route("/support/admin/reply", methods=["POST"])
 @admins_only
@@ -404,41 +551,50 @@ def support_admin_reply():
     except ValueError:
         return jsonify({"ok": False, "error": "Invalid ticket_id"}), 400
     
-    t = SupportTicket.query.get_or_404(ticket_id)
-    if t.status != "open":
-        return jsonify({"ok": False, "error": "Ticket is closed"}), 400
-    
     admin = get_current_user()
     text = (request.values.get("text") or "").strip()
     if not text:
         return jsonify({"ok": False, "error": "Empty message"}), 400
+    if too_long(text):
+        return _too_long_response()
     
-    # Create admin message
-    m = SupportMessage(ticket_id=ticket_id, sender_role="admin", sender_id=admin.id, text=text)
-    t.updated = datetime.utcnow()
+    # Lock the ticket before anything else: a player post landing between reading
+    # pending_user_messages and zeroing it would otherwise be lost from the ticket
+    t = (SupportTicket.query.filter_by(id=ticket_id)
+         .with_for_update().populate_existing().first_or_404())
+    if t.status != "open":
+        return jsonify({"ok": False, "error": "Ticket is closed"}), 400
+    
+    # Message, ticket timestamp and the player's unread counter commit together
+    now = datetime.utcnow()
+    m = SupportMessage(ticket_id=ticket_id, sender_role="admin", sender_id=admin.id, created=now,
+                       **message_fields(text))
+    answered = t.pending_user_messages
+    t.updated = now
+    t.pending_user_messages = 0
+    if t.first_response_at is None and t.first_user_message_at is not None:
+        t.first_response_at = now
+        t.first_responder_id = admin.id
     db.session.add(m)
     db.session.flush()  # Get the message ID
-    
-    # Update user notification count
-    notification = UserNotification.query.filter_by(
-        user_id=t.user_id, 
-        ticket_id=ticket_id
-    ).first()
-    
-    if notification:
-        # Increment unread admin message count
-        notification.unread_admin_count += 1
-        notification.updated = datetime.utcnow()
-    else:
-        # Create new notification record
-        notification = UserNotification(
-            user_id=t.user_id,
-            ticket_id=ticket_id,
-            last_seen_message_id=0,
-            unread_admin_count=1
-        )
-        db.session.add(notification)
-    
+    _note_message(t, m)
+    _mark_read(admin.id, t)
+    
+    db.session.execute(upsert(UserNotification, {
+        "user_id": t.user_id,
+        "ticket_id": ticket_id,
+        "last_seen_message_id": 0,
+        "unread_admin_count": 1,
+        "created": now,
+        "updated": now,
+    }, ["user_id", "ticket_id"], {
+        "unread_admin_count": UserNotification.unread_admin_count + 1,
+        "updated": now,
+    }))
+    
+    # Shared counter rows last, like every write path (see stats.bump)
+    bump({UNREAD_BY_ADMIN: -answered})
+    record_messages("admin", when=now)
     db.session.commit()
     return jsonify({"ok": True, "message": m.to_dict()})
 
@@ -454,9 +610,8 @@ def support_admin_close():
     except ValueError:
         return jsonify({"ok": False, "error": "Invalid ticket_id"}), 400
     
-    t = SupportTicket.query.get_or_404(ticket_id)
-    t.status = "closed"
-    t.updated = datetime.utcnow()
+    SupportTicket.query.get_or_404(ticket_id)
+    set_status(ticket_criteria([ticket_id]), "closed")
     db.session.commit()
     return jsonify({"ok": True, "status": "closed"})
 
@@ -472,16 +627,10 @@ def support_admin_delete():
     except ValueError:
         return jsonify({"ok": False, "error": "Invalid ticket_id"}), 400
     
-    t = SupportTicket.query.get_or_404(ticket_id)
-    
-    # Delete notification records first
-    UserNotification.query.filter_by(ticket_id=ticket_id).delete()
-    
-    # Delete all messages first (foreign key constraint)
-    SupportMessage.query.filter_by(ticket_id=ticket_id).delete()
+    SupportTicket.query.get_or_404(ticket_id)
     
-    # Then delete the ticket
-    db.session.delete(t)
+    # Notifications, messages and the ticket go together (and leave the counters)
+    delete_tickets(ticket_criteria([ticket_id]))
     db.session.commit()
     
     return jsonify({"ok": True, "message": "Ticket deleted successfully"})
@@ -505,6 +654,8 @@ def support_admin_broadcast():
     
     if not message:
         return jsonify({"ok": False, "error": "Empty message"}), 400
+    if too_long(message):
+        return _too_long_response()
     
     admin = get_current_user()
     current_time = datetime.utcnow()
@@ -524,36 +675,55 @@ def support_admin_broadcast():
         db.session.rollback()  # Ensure rollback on error
         return jsonify({"ok": False, "error": f"Server error: {str(e)}"}), 500
 
-def _broadcast_to_all_users(message, admin, current_time):
-    """Broadcast to all users with improved error handling and batch processing"""
-    
-    # Get all users in batches to avoid memory issues
-    BATCH_SIZE = 100
-    total_users = Users.query.count()
+BROADCAST_BATCH_SIZE = 100  # users per transaction; also keeps multi-row INSERTs under SQLite's parameter cap
+
+def _id_batches(query, column):
+    """Keyset-paginate the ids selected by `query` in broadcast-sized batches"""
+    last_id = 0
+    while True:
+        ids = [row[0] for row in query.filter(column > last_id)
+               .order_by(column.asc()).limit(BROADCAST_BATCH_SIZE).all()]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+def _send_broadcast(batches, text, admin, current_time, open_missing=True):
+    """Deliver `text` to each batch of user ids, one transaction per batch.
+
+    Users without an open ticket get one unless `open_missing` is off. Returns
+    (tickets_created, messages_sent, errors); a failed batch is rolled back and
+    reported without stopping the rest.
+    """
     tickets_created = 0
     messages_sent = 0
     errors = []
     
-    print(f"[BROADCAST] Starting broadcast to {total_users} users in batches of {BATCH_SIZE}")
-    
-    # Process users in batches
-    for offset in range(0, total_users, BATCH_SIZE):
-        users_batch = Users.query.offset(offset).limit(BATCH_SIZE).all()
-        
+    for number, user_ids in enumerate(batches, 1):
         try:
-            # Process each batch in a separate transaction
-            batch_created, batch_sent = _process_user_batch(users_batch, message, admin, current_time)
-            tickets_created += batch_created
-            messages_sent += batch_sent
-            
-            print(f"[BROADCAST] Processed batch {offset//BATCH_SIZE + 1}: {batch_sent} messages sent")
-            
+            # Strict mode raises here, before the commit, so an over-budget batch is rolled back
+            with query_budget(f"broadcast batch {number}", BROADCAST_BATCH_BUDGET):
+                batch_created, batch_sent = broadcast_batch(user_ids, text, admin.id, current_time, open_missing)
+            db.session.commit()
         except Exception as e:
-            error_msg = f"Batch {offset//BATCH_SIZE + 1} failed: {str(e)}"
+            db.session.rollback()
+            error_msg = f"Batch {number} failed: {str(e)}"
             errors.append(error_msg)
             print(f"[BROADCAST ERROR] {error_msg}")
-            db.session.rollback()
-            continue  # Continue with next batch
+            continue
+        
+        tickets_created += batch_created
+        messages_sent += batch_sent
+        print(f"[BROADCAST] Processed batch {number}: {batch_sent} messages sent")
+    
+    return tickets_created, messages_sent, errors
+
+def _broadcast_to_all_users(message, admin, current_time):
+    """Broadcast to all users, opening tickets for those without one"""
+    tickets_created, messages_sent, errors = _send_broadcast(
+        _id_batches(Users.query.with_entities(Users.id), Users.id),
+        f"[BROADCAST] {message}", admin, current_time,
+    )
     
     # Return results
     if errors:
@@ -561,215 +731,307 @@ def _broadcast_to_all_users(message, admin, current_time):
         return jsonify({
             "ok": True,
             "message": f"Broadcast sent to {messages_sent} users ({tickets_created} new tickets){error_summary}",
+            "tickets_created": tickets_created,
             "errors": errors
         })
     else:
         return jsonify({
             "ok": True, 
-            "message": f"Broadcast sent to {messages_sent} users ({tickets_created} new tickets created)"
+            "message": f"Broadcast sent to {messages_sent} users ({tickets_created} new tickets created)",
+            "tickets_created": tickets_created,
         })
 
-def _process_user_batch(users_batch, message, admin, current_time):
-    """Process a batch of users for broadcasting"""
-    tickets_created = 0
-    messages_sent = 0
-    
-    for user in users_batch:
-        try:
-            # Check if user already has an open ticket
-            existing_ticket = SupportTicket.query.filter_by(
-                user_id=user.id, 
-                status="open"
-            ).first()
-            
-            if existing_ticket:
-                # Use existing ticket
-                ticket = existing_ticket
-            else:
-                # Create new ticket
-                ticket = SupportTicket(user_id=user.id, status="open")
-                db.session.add(ticket)
-                tickets_created += 1
-            
-            # Add broadcast message
-            broadcast_message = SupportMessage(
-                ticket_id=ticket.id if existing_ticket else None,  # Will be set after flush for new tickets
-                sender_role="admin", 
-                sender_id=admin.id, 
-                text=f"[BROADCAST] {message}"
-            )
-            
-            # Update ticket timestamp
-            ticket.updated = current_time
-            
-            # If it's a new ticket, we need to flush to get the ID
-            if not existing_ticket:
-                db.session.flush()  # Get the ticket ID without committing
-                broadcast_message.ticket_id = ticket.id
-            
-            db.session.add(broadcast_message)
-            db.session.flush()  # Get message ID
-            messages_sent += 1
-            
-            # Update notification count for broadcast messages
-            notification = UserNotification.query.filter_by(
-                user_id=user.id,
-                ticket_id=ticket.id
-            ).first()
-            
-            if notification:
-                notification.unread_admin_count += 1
-                notification.updated = current_time
-            else:
-                notification = UserNotification(
-                    user_id=user.id,
-                    ticket_id=ticket.id,
-                    last_seen_message_id=0,
-                    unread_admin_count=1
-                )
-                db.session.add(notification)
-            
-        except Exception as e:
-            print(f"[BROADCAST] Failed to process user {user.id} ({user.name}): {str(e)}")
-            # Continue with other users in the batch
-            continue
+def _broadcast_to_open_tickets(message, admin, current_time):
+    """Broadcast to users with open tickets; a ticket closed meanwhile is skipped, never reopened"""
+    tickets_created, messages_sent, errors = _send_broadcast(
+        _id_batches(SupportTicket.query.with_entities(SupportTicket.open_user_id), SupportTicket.open_user_id),
+        f"[BROADCAST] {message}", admin, current_time, open_missing=False,
+    )
+    response = {
+        "ok": True,
+        "message": f"Broadcast sent to {messages_sent} open tickets ({tickets_created} new tickets)",
+        "tickets_created": tickets_created,
+    }
+    if errors:
+        response["errors"] = errors
+    return jsonify(response)
+
+def _broadcast_to_team(message, admin, current_time, team_id):
+    """Broadcast to users in a specific team"""
+    from CTFd.models import Teams
+    team = Teams.query.get_or_404(team_id)
     
-    # Commit the entire batch
-    db.session.commit()
-    return tickets_created, messages_sent
+    tickets_created, messages_sent, errors = _send_broadcast(
+        _id_batches(Users.query.with_entities(Users.id).filter(Users.team_id == team.id), Users.id),
+        f"[BROADCAST to {team.name}] {message}", admin, current_time,
+    )
+    response = {
+        "ok": True,
+        "message": f"Broadcast sent to {messages_sent} users in team {team.name} ({tickets_created} new tickets)",
+        "tickets_created": tickets_created,
+    }
+    if errors:
+        response["errors"] = errors
+    return jsonify(response)
 
-def _broadcast_to_open_tickets(message, admin, current_time):
-    """Broadcast to users with open tickets"""
+# -------------------- BULK --------------------
+@bp.route("/support/admin/bulk", methods=["POST"])
+@admins_only
+def support_admin_bulk():
+    """Close, delete or re-status a set of tickets (ids and/or filter) in one go"""
+    nonce = request.values.get("nonce", "")
+    
+    # CSRF validation
+    if nonce != session.get("nonce", ""):
+        return jsonify({"ok": False, "error": "Invalid nonce"}), 403
+    
+    action = (request.values.get("action") or "").strip().lower()
+    status = (request.values.get("status") or "").strip().lower()
+    if action == "close":
+        status = "closed"
+    elif action == "status":
+        if status not in STATUSES:
+            return jsonify({"ok": False, "error": "Bad status"}), 400
+    elif action != "delete":
+        return jsonify({"ok": False, "error": "Invalid action"}), 400
+    
     try:
-        open_tickets = SupportTicket.query.filter_by(status="open").all()
-        messages_sent = 0
-        
-        for ticket in open_tickets:
-            try:
-                broadcast_message = SupportMessage(
-                    ticket_id=ticket.id,
-                    sender_role="admin",
-                    sender_id=admin.id,
-                    text=f"[BROADCAST] {message}"
-                )
-                ticket.updated = current_time
-                db.session.add(broadcast_message)
-                db.session.flush()  # Get message ID
-                
-                # Update notification count
-                notification = UserNotification.query.filter_by(
-                    user_id=ticket.user_id,
-                    ticket_id=ticket.id
-                ).first()
-                
-                if notification:
-                    notification.unread_admin_count += 1
-                    notification.updated = current_time
-                else:
-                    notification = UserNotification(
-                        user_id=ticket.user_id,
-                        ticket_id=ticket.id,
-                        last_seen_message_id=0,
-                        unread_admin_count=1
-                    )
-                    db.session.add(notification)
-                
-                messages_sent += 1
-            except Exception as e:
-                print(f"[BROADCAST] Failed to send to ticket {ticket.id}: {str(e)}")
-                continue
-        
+        raw_ids = request.values.get("ticket_ids")
+        ticket_ids = [int(i) for i in raw_ids.split(",") if i.strip()] if raw_ids else None
+        inactive_hours = float(request.values.get("inactive_hours") or 0) or None
+    except ValueError:
+        return jsonify({"ok": False, "error": "Invalid ticket_ids or inactive_hours"}), 400
+    
+    filter_status = (request.values.get("filter_status") or "").strip().lower() or None
+    if filter_status and filter_status not in STATUSES:
+        return jsonify({"ok": False, "error": "Bad filter_status"}), 400
+    
+    # Refuse to act on every ticket by accident
+    if not ticket_ids and not filter_status and not inactive_hours:
+        return jsonify({"ok": False, "error": "No tickets selected"}), 400
+    
+    criteria = ticket_criteria(ticket_ids, filter_status, inactive_hours)
+    try:
+        if action == "delete":
+            affected = delete_tickets(criteria)
+        else:
+            affected = set_status(criteria, status)
         db.session.commit()
-        return jsonify({
-            "ok": True,
-            "message": f"Broadcast sent to {messages_sent} open tickets"
-        })
-        
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": "Some users already have an open ticket"}), 409
     except Exception as e:
+        print(f"[BULK ERROR] {str(e)}")
         db.session.rollback()
-        raise e
+        return jsonify({"ok": False, "error": f"Server error: {str(e)}"}), 500
+    
+    return jsonify({"ok": True, "action": action, "affected": affected})
 
-def _broadcast_to_team(message, admin, current_time, team_id):
-    """Broadcast to users in a specific team"""
+_last_auto_close = 0.0
+def _maybe_auto_close(min_interval=600):
+    """Close stale tickets at most every `min_interval` seconds per worker"""
+    global _last_auto_close
+    hours = float(_setting("AUTO_CLOSE_HOURS", 0) or 0)
+    if not hours or time.time() - _last_auto_close < min_interval:
+        return
+    _last_auto_close = time.time()
     try:
-        from CTFd.models import Teams
-        team = Teams.query.get_or_404(team_id)
-        team_users = Users.query.filter_by(team_id=team_id).all()
-        
-        tickets_created = 0
-        messages_sent = 0
-        
-        for user in team_users:
-            try:
-                # Get or create open ticket
-                ticket = SupportTicket.query.filter_by(
-                    user_id=user.id, 
-                    status="open"
-                ).first()
-                
-                if not ticket:
-                    ticket = SupportTicket(user_id=user.id, status="open")
-                    db.session.add(ticket)
-                    db.session.flush()  # Get ID
-                    tickets_created += 1
-                
-                broadcast_message = SupportMessage(
-                    ticket_id=ticket.id,
-                    sender_role="admin", 
-                    sender_id=admin.id,
-                    text=f"[BROADCAST to {team.name}] {message}"
-                )
-                ticket.updated = current_time
-                db.session.add(broadcast_message)
-                db.session.flush()
-                
-                # Update notification count
-                notification = UserNotification.query.filter_by(
-                    user_id=user.id,
-                    ticket_id=ticket.id
-                ).first()
-                
-                if notification:
-                    notification.unread_admin_count += 1
-                    notification.updated = current_time
-                else:
-                    notification = UserNotification(
-                        user_id=user.id,
-                        ticket_id=ticket.id,
-                        last_seen_message_id=0,
-                        unread_admin_count=1
-                    )
-                    db.session.add(notification)
-                
-                messages_sent += 1
-                
-            except Exception as e:
-                print(f"[BROADCAST] Failed to process team user {user.id}: {str(e)}")
-                continue
-        
-        db.session.commit()
-        return jsonify({
-            "ok": True,
-            "message": f"Broadcast sent to {messages_sent} users in team {team.name} ({tickets_created} new tickets)"
-        })
-        
+        auto_close_stale_tickets(hours)
     except Exception as e:
+        print(f"[AUTO-CLOSE ERROR] {str(e)}")
         db.session.rollback()
-        raise e
 
 # Keep the old status endpoint for backward compatibility
 @bp.route("/support/admin/status/<int:tid>", methods=["POST"])
 @admins_only
 def support_admin_status(tid):
-    t = SupportTicket.query.get_or_404(tid)
+    SupportTicket.query.get_or_404(tid)
     status = (request.values.get("status") or "").strip().lower()
-    if status not in ("open", "closed", "pending"):
+    if status not in STATUSES:
         return jsonify({"ok": False, "error": "Bad status"}), 400
-    t.status = status
-    t.updated = datetime.utcnow()
-    db.session.commit()
+    try:
+        set_status(ticket_criteria([tid]), status)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": "User already has an open ticket"}), 409
     return jsonify({"ok": True, "status": status})
 
+# -------------------- STATS --------------------
+@bp.route("/support/admin/stats", methods=["GET"])
+@admins_only
+def support_admin_stats():
+    """Dashboard numbers from the running counters - cheap enough to poll"""
+    return _json({"ok": True, "total_users": _total_users(), **snapshot()})
+
+TOTAL_USERS_CACHE_SECONDS = 300
+
+def _total_users():
+    """Registered users, cached: a COUNT over CTFd's users table is too much for a 15 s poll"""
+    total = _cache_get("support_chat:total_users")
+    if total is None:
+        total = Users.query.count()
+        _cache_set("support_chat:total_users", total, TOTAL_USERS_CACHE_SECONDS)
+    return total
+
+# -------------------- RETENTION --------------------
+def _run_retention_from_config():
+    return run_retention(
+        archive_after_days=int(_setting("ARCHIVE_AFTER_DAYS", 30)),
+        broadcast_after_days=int(_setting("BROADCAST_RETENTION_DAYS", 7)),
+        batch_size=int(_setting("RETENTION_BATCH_SIZE", 200)),
+    )
+
+@bp.route("/support/admin/retention", methods=["POST"])
+@admins_only
+def support_admin_retention():
+    """Archive old closed tickets, early for broadcast-only ones, now"""
+    nonce = request.values.get("nonce", "")
+    
+    # CSRF validation
+    if nonce != session.get("nonce", ""):
+        return jsonify({"ok": False, "error": "Invalid nonce"}), 403
+    
+    try:
+        result = _run_retention_from_config()
+    except Exception as e:
+        print(f"[RETENTION ERROR] {str(e)}")
+        return jsonify({"ok": False, "error": f"Server error: {str(e)}"}), 500
+    
+    return jsonify({"ok": True, **result})
+
+@bp.route("/support/admin/archive", methods=["GET"])
+@admins_only
+def support_admin_archive():
+    """Page through archived tickets, newest archive first"""
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    per_page = 50
+    
+    rows = (SupportTicketArchive.query
+            .order_by(SupportTicketArchive.archived.desc(), SupportTicketArchive.id.desc())
+            .offset((page - 1) * per_page).limit(per_page + 1).all())
+    users, _ = _lookup_users(t.user_id for t in rows[:per_page])
+    
+    tickets = []
+    for t in rows[:per_page]:
+        user = users.get(t.user_id)
+        tickets.append({
+            "id": t.id,
+            "user_id": t.user_id,
+            "user_name": user.name if user else None,
+            "status": t.status,
+            "updated": to_epoch_ms(t.updated),
+            "archived": to_epoch_ms(t.archived),
+        })
+    
+    return jsonify({"ok": True, "page": page, "has_more": len(rows) > per_page, "tickets": tickets})
+
+@bp.route("/support/admin/archive/<int:ticket_id>", methods=["GET"])
+@admins_only
+def support_admin_archived_ticket(ticket_id):
+    t, msgs = get_archived_ticket(ticket_id)
+    if not t:
+        return jsonify({"ok": False, "error": "Ticket not found"}), 404
+    return _json({"ticket": _ticket_detail(t, msgs, archived=True)})
+
+# -------------------- SEARCH --------------------
+def _parse_date(value):
+    """Parse a YYYY-MM-DD filter given in display time into naive UTC"""
+    if not value:
+        return None
+    try:
+        local = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=_display_tz())
+    except ValueError:
+        return None
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+@bp.route("/support/admin/search", methods=["GET"])
+@admins_only
+def support_admin_search():
+    """Full-text search over message text, filterable by team, sender role and date"""
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"ok": False, "error": "Empty query"}), 400
+    
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        team_id = int(request.args.get("team_id")) if request.args.get("team_id") else None
+    except ValueError:
+        return jsonify({"ok": False, "error": "Invalid page or team_id"}), 400
+    
+    date_to = _parse_date(request.args.get("to"))
+    if date_to:
+        date_to += timedelta(days=1)  # inclusive of the whole "to" day
+    
+    msgs, has_more = search_messages(
+        q,
+        team_id=team_id,
+        sender_role=request.args.get("role"),
+        date_from=_parse_date(request.args.get("from")),
+        date_to=date_to,
+        page=page,
+    )
+    
+    # Resolve ticket owners, senders and teams in bulk rather than per result
+    owners = {}
+    if msgs:
+        owners = dict(SupportTicket.query
+                      .with_entities(SupportTicket.id, SupportTicket.user_id)
+                      .filter(SupportTicket.id.in_({m.ticket_id for m in msgs})).all())
+    users, teams = _lookup_users(set(owners.values()) | {m.sender_id for m in msgs})
+    
+    results = []
+    for m in msgs:
+        d = m.to_dict()
+        owner = users.get(owners.get(m.ticket_id))
+        sender = users.get(m.sender_id)
+        d["sender_name"] = sender.name if sender else None
+        d["user_name"] = owner.name if owner else None
+        team = teams.get(getattr(owner, "team_id", None)) if owner else None
+        d["team_name"] = team.name if team else None
+        results.append(d)
+    
+    return _json({"ok": True, "page": page, "has_more": has_more, "results": _message_list(results)})
+
+# -------------------- EXPORT --------------------
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_stream, "application/x-ndjson"),
+    "csv": (csv_stream, "text/csv"),
+}
+
+@bp.route("/support/admin/export", methods=["GET"])
+@admins_only
+def support_admin_export():
+    """Stream every message (or one ticket's) as NDJSON or CSV; archive=1 adds archived threads"""
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"ok": False, "error": "Invalid format"}), 400
+    
+    try:
+        ticket_id = int(request.args.get("ticket_id")) if request.args.get("ticket_id") else None
+    except ValueError:
+        return jsonify({"ok": False, "error": "Invalid ticket_id"}), 400
+    
+    stream, mimetype = EXPORT_FORMATS[fmt]
+    rows = iter_message_rows(
+        ticket_id=ticket_id,
+        since=_parse_date(request.args.get("since")),
+        include_archive=request.args.get("archive") == "1",
+    )
+    filename = f"support-chat-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    
+    return Response(
+        stream_with_context(stream(rows)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no",  # let nginx pass chunks straight through
+        },
+    )
+
 # -------------------- TRANSLATION --------------------
 def _detect_lang(text):
     """Simple language detection based on common patterns"""
@@ -879,6 +1141,11 @@ def translate_text():
     
     if not text:
         return jsonify({"ok": False, "error": "Empty text"}), 400
+    
+    limited = _rate_limited("translate", get_current_user().id,
+                            _setting("TRANSLATE_BURST", 10), _setting("TRANSLATIONS_PER_MINUTE", 30))
+    if limited:
+        return limited
 
     try:
         # Detect source language
@@ -939,26 +1206,126 @@ def translate_text():
         })
 
 # -------------------- LOAD & ASSETS --------------------
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+DIST_DIR = os.path.join(ASSETS_DIR, "dist")
+_bundle_files = {}  # fingerprinted filename -> bundle entry, filled in load()
+
+@bp.route("/plugins/support_chat/dist/<path:filename>", methods=["GET"])
+def support_chat_dist(filename):
+    """Serve fingerprinted assets from memory, precompressed, cached for a year"""
+    asset = _bundle_files.get(filename)
+    if not asset:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    
+    encoding = "identity"
+    for candidate in ("br", "gzip"):
+        if candidate in asset["bodies"] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    
+    response = Response(asset["bodies"][encoding], content_type=asset["mimetype"])
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    # The filename changes whenever the content does, so it never needs revalidating
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.set_etag(f'{asset["etag"]}-{encoding}')
+    return response.make_conditional(request)
+
 def load(app):
+    global _limiter
+    _limiter = RateLimiter(
+        redis_url=app.config.get("SUPPORT_CHAT_RATELIMIT_REDIS_URL") or app.config.get("REDIS_URL"),
+        sqlite_path=app.config.get("SUPPORT_CHAT_RATELIMIT_DB"),
+    )
+
+    configure_chat_bind(app)
     with app.app_context():
         # Create all tables including the new UserNotification table
         db.create_all()
+        ensure_schema()
+        ensure_counters()
+        ensure_search_index()
 
     register_plugin_assets_directory(
         app, base_path="/plugins/support_chat/assets", endpoint="support_chat_assets"
     )
+    init_query_budget(app, bp)
     app.register_blueprint(bp)
 
+    @app.cli.command("support-chat-retention")
+    def support_chat_retention():
+        """Archive old closed support tickets, early for broadcast-only ones"""
+        with app.app_context():
+            result = _run_retention_from_config()
+        print(f"[RETENTION] {result}")
+
+    @app.cli.command("support-chat-build-assets")
+    def support_chat_build_assets():
+        """Write minified, fingerprinted, precompressed widget assets to assets/dist"""
+        for name, asset in build_bundle(ASSETS_DIR, out_dir=DIST_DIR).items():
+            print(f"[ASSETS] {name} -> dist/{asset['filename']} ({', '.join(asset['bodies'])})")
+
+    @app.cli.command("support-chat-export")
+    @click.option("--format", "fmt", type=click.Choice(sorted(EXPORT_FORMATS)), default="ndjson")
+    @click.option("--ticket-id", type=int, default=None)
+    @click.option("--since", default=None, help="YYYY-MM-DD, in the display timezone")
+    @click.option("--include-archive", is_flag=True, help="Also export threads moved out by retention")
+    @click.option("--output", type=click.File("w", encoding="utf-8"), default="-")
+    def support_chat_export(fmt, ticket_id, since, include_archive, output):
+        """Export support chat transcripts as NDJSON or CSV"""
+        stream, _ = EXPORT_FORMATS[fmt]
+        with app.app_context():
+            since_utc = _parse_date(since)
+            if since and not since_utc:
+                raise click.BadParameter("expected YYYY-MM-DD", param_hint="--since")
+            rows = iter_message_rows(ticket_id=ticket_id, since=since_utc, include_archive=include_archive)
+            for chunk in stream(rows):
+                output.write(chunk)
+
+    @app.cli.command("support-chat-auto-close")
+    def support_chat_auto_close():
+        """Close support tickets inactive for SUPPORT_CHAT_AUTO_CLOSE_HOURS (default 48)"""
+        with app.app_context():
+            hours = float(_setting("AUTO_CLOSE_HOURS", 0) or 48)
+            closed = auto_close_stale_tickets(hours)
+        print(f"[AUTO-CLOSE] {closed} tickets closed")
+
+    @app.cli.command("support-chat-rebuild-stats")
+    def support_chat_rebuild_stats():
+        """Recompute the support statistics counters from the ticket tables"""
+        with app.app_context():
+            counters = rebuild_counters()
+        print(f"[STATS] {counters}")
+
     try:
         from CTFd.plugins import register_admin_plugin_menu_bar
         register_admin_plugin_menu_bar(title="Support Chat", route="/support/admin")
     except Exception:
         pass
 
+    # Read the bundle `flask support-chat-build-assets` left in assets/dist, or build it in
+    # memory; startup never writes into the package. Every page render reuses the tags.
+    bundle = load_bundle(ASSETS_DIR, DIST_DIR) or build_bundle(ASSETS_DIR)
+    _bundle_files.clear()
+    _bundle_files.update({asset["filename"]: asset for asset in bundle.values()})
+    
+    dist_url = (app.config.get("APPLICATION_ROOT") or "/").rstrip("/") + "/plugins/support_chat/dist"
+    timezone_name = app.config.get("SUPPORT_CHAT_DISPLAY_TIMEZONE", DEFAULT_DISPLAY_TIMEZONE)
+    if _zone(timezone_name) is None:
+        print(f"[TIMEZONE] Unknown SUPPORT_CHAT_DISPLAY_TIMEZONE {timezone_name!r}; showing times in UTC")
+        timezone_name = "UTC"
+    app.config["SUPPORT_CHAT_DISPLAY_TIMEZONE"] = timezone_name
+    assets_tag = (
+        f'<link rel="stylesheet" href="{dist_url}/{bundle["support.css"]["filename"]}">'
+        f'<script src="{dist_url}/{bundle["support.js"]["filename"]}" data-timezone="{timezone_name}" defer></script>'
+    )
+    widget_context = dict(
+        support_chat_assets=lambda: assets_tag,
+        support_chat_admin_js=f'{dist_url}/{bundle["admin.js"]["filename"]}',
+        support_chat_timezone=timezone_name,
+    )
+
     @app.context_processor
     def inject_support_widget():
-        def support_chat_assets():
-            css = url_for("support_chat_assets", path="support.css")
-            js = url_for("support_chat_assets", path="support.js")
-            return f'<link rel="stylesheet" href="{css}"><script src="{js}" defer></script>'
-        return dict(support_chat_assets=support_chat_assets)
\ No newline at end of file
+        return widget_context
\ No newline at end of file
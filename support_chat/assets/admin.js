@@ -1,7 +1,10 @@
-/* admin.js — Updated with consistent UTC+8 timezone formatting */
+/* admin.js — Compact payloads and client-side timezone formatting */
 (function () {
   if (!location.pathname.startsWith("/support/admin")) return;
 
+  // Display timezone comes from the <script data-timezone> tag in support_admin.html
+  const DISPLAY_TZ = (document.currentScript && document.currentScript.dataset.timezone) || undefined;
+
   let cachedNonce = null;
   async function getNonce() {
     if (typeof window.csrf_token === "string" && window.csrf_token) return window.csrf_token;
@@ -17,24 +20,40 @@
 
   function esc(s){ return (s||"").replace(/[&<>"]/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'}[c])); }
 
-  // UTC+8 date formatting function - handles timestamps already converted by server
-  function formatDate(dateStr) {
-    if (!dateStr || dateStr === 'N/A') return 'N/A';
+  // Built once; falls back to the browser's zone if the configured one is unknown
+  const dateFormat = (() => {
+    const opts = { hour12: false, month: '2-digit', day: '2-digit', hour: '2-digit', minute: '2-digit' };
     try {
-      // Server already sends UTC+8 converted timestamps, so just parse and format
-      const date = new Date(dateStr);
-      
-      // Format as MM/DD HH:MM
-      return String(date.getMonth() + 1).padStart(2, '0') + '/' + 
-             String(date.getDate()).padStart(2, '0') + ' ' +
-             String(date.getHours()).padStart(2, '0') + ':' +
-             String(date.getMinutes()).padStart(2, '0');
+      return new Intl.DateTimeFormat('en-US', { ...opts, timeZone: DISPLAY_TZ });
+    } catch {
+      return new Intl.DateTimeFormat('en-US', opts);
+    }
+  })();
+
+  // Server sends epoch milliseconds (UTC); format as MM/DD HH:MM
+  function formatDate(ts) {
+    if (ts === null || ts === undefined || ts === '' || ts === 'N/A') return 'N/A';
+    try {
+      const parts = {};
+      dateFormat.formatToParts(new Date(Number(ts))).forEach(p => { parts[p.type] = p.value; });
+      const hour = parts.hour === '24' ? '00' : parts.hour;
+      return `${parts.month}/${parts.day} ${hour}:${parts.minute}`;
     } catch (e) {
       console.error('Date formatting error:', e);
       return 'Invalid Date';
     }
   }
 
+  // Message lists arrive column-encoded ({fields, rows}) to keep payloads small
+  function unpackRows(list) {
+    if (!list || Array.isArray(list)) return list || [];
+    return list.rows.map(row => {
+      const obj = {};
+      list.fields.forEach((f, i) => { obj[f] = row[i]; });
+      return obj;
+    });
+  }
+
   function hasNonEnglishContent(text) {
     if (!text) return false;
     
@@ -55,11 +74,116 @@
     return foreignWords.some(word => lowerText.includes(word));
   }
 
+  // Language detection per message id; message text never changes
+  const langCache = new Map();
+  function needsTranslation(m) {
+    if (!langCache.has(m.id)) langCache.set(m.id, hasNonEnglishContent(m.text));
+    return langCache.get(m.id);
+  }
+
+  // Keyed, windowed message list: bubbles are appended by message id instead of
+  // rebuilding the list, and long threads keep only WINDOW bubbles in the DOM,
+  // sliding by CHUNK as the reader scrolls toward either edge
+  function createThreadWindow(box, bubble) {
+    const WINDOW = 150, CHUNK = 50, EDGE = 40;
+    let msgs = [], ids = new Set(), start = 0, end = 0, queued = false;
+
+    const nodes = () => Array.from(box.querySelectorAll(":scope > [data-mid]"));
+    const html = (from, to) => msgs.slice(from, to).map(m => bubble(m)).join("");
+
+    function dropTop(n) {
+      if (n <= 0) return;
+      const before = box.scrollHeight;
+      nodes().slice(0, n).forEach(el => el.remove());
+      box.scrollTop -= before - box.scrollHeight;
+      start += n;
+    }
+
+    function dropBottom(n) {
+      if (n <= 0) return;
+      nodes().slice(-n).forEach(el => el.remove());
+      end -= n;
+    }
+
+    function showLatest() {
+      nodes().forEach(el => el.remove());
+      start = Math.max(0, msgs.length - WINDOW);
+      end = msgs.length;
+      box.insertAdjacentHTML("beforeend", html(start, end));
+      box.scrollTop = box.scrollHeight;
+    }
+
+    function slide() {
+      if (box.scrollTop < EDGE && start > 0) {
+        const from = Math.max(0, start - CHUNK);
+        const before = box.scrollHeight;
+        nodes()[0].insertAdjacentHTML("beforebegin", html(from, start));
+        box.scrollTop += box.scrollHeight - before;
+        start = from;
+        dropBottom(end - start - WINDOW);
+      } else if (box.scrollHeight - box.scrollTop - box.clientHeight < EDGE && end < msgs.length) {
+        const to = Math.min(msgs.length, end + CHUNK);
+        box.insertAdjacentHTML("beforeend", html(end, to));
+        end = to;
+        dropTop(end - start - WINDOW);
+      }
+    }
+
+    box.addEventListener("scroll", () => {
+      if (queued) return;
+      queued = true;
+      requestAnimationFrame(() => { queued = false; slide(); });
+    });
+
+    return {
+      get size() { return msgs.length; },
+      has(id) { return ids.has(id); },
+
+      // Append messages whose id is new and return them. If the reader has
+      // scrolled back through history they stay put unless `follow` is set.
+      update(list, follow) {
+        const fresh = list.filter(m => !ids.has(m.id));
+        if (!fresh.length) return fresh;
+        const atTail = end === msgs.length;
+        fresh.forEach(m => { ids.add(m.id); msgs.push(m); });
+        if (!atTail && !follow) return fresh;
+        if (!atTail || msgs.length - end > WINDOW) {
+          showLatest();
+          return fresh;
+        }
+        box.insertAdjacentHTML("beforeend", html(end, msgs.length));
+        end = msgs.length;
+        dropTop(end - start - WINDOW);
+        box.scrollTop = box.scrollHeight;
+        return fresh;
+      },
+
+      reset() {
+        nodes().forEach(el => el.remove());
+        msgs = [];
+        ids = new Set();
+        start = end = 0;
+      }
+    };
+  }
+
   const detail = document.querySelector("#sc-admin-detail");
+  let view = null;  // Ticket currently rendered: {id, status, archived, box, thread}
 
   // Render a ticket thread in the improved layout
   function renderThread(ticket) {
-    const msgs = ticket.messages || [];
+    const msgs = unpackRows(ticket.messages);
+    
+    // Same ticket, same state: only new bubbles need to go in
+    if (view && view.id === ticket.id && view.status === ticket.status &&
+        view.archived === !!ticket.archived && detail.contains(view.box) &&
+        msgs.length >= view.thread.size) {
+      if (view.thread.update(msgs, true).length) {
+        view.box.querySelector('.sc-thread-empty').style.display = 'none';
+      }
+      return;
+    }
+    
     const user = ticket.user || {};
     const userName = user.name || "Unknown User";
     const userEmail = user.email || "";
@@ -88,67 +212,31 @@
             </div>
           </div>
           <div class="d-flex" style="gap: 0.5rem;">
-            ${ticket.status === 'open' ? 
+            ${ticket.archived ? '<span class="badge badge-dark">archived</span>' : ''}
+            ${ticket.status === 'open' && !ticket.archived ? 
               `<button class="btn btn-warning btn-sm" id="sc-close" data-id="${ticket.id}">
                 <i class="fas fa-times mr-1"></i>Close
               </button>` : ''
             }
-            <button class="btn btn-danger btn-sm" id="sc-delete" data-id="${ticket.id}" title="Permanently delete this ticket">
-              <i class="fas fa-trash mr-1"></i>Delete
-            </button>
+            ${!ticket.archived ? 
+              `<button class="btn btn-danger btn-sm" id="sc-delete" data-id="${ticket.id}" title="Permanently delete this ticket">
+                <i class="fas fa-trash mr-1"></i>Delete
+              </button>` : ''
+            }
           </div>
         </div>
       </div>
     `;
 
-    const messagesHtml = msgs.map(m => {
-      const isAdmin = m.sender_role === "admin";
-      let role = isAdmin ? "Admin" : "User";
-      
-      // Show username and team for user messages
-      if (!isAdmin && m.sender_name) {
-        role = m.sender_name;
-        if (m.sender_team) {
-          role = `${m.sender_name} (Team ${m.sender_team})`;
-        }
-      }
-      
-      const messageClass = isAdmin ? "message-admin" : "message-user";
-      const textId = `adm-b-${m.id || (Math.random()+"").slice(2)}`;
-      
-      // Use consistent date formatting (server already provides UTC+8)
-      const timestamp = formatDate(m.created);
-      
-      // Only show translate link if content needs translation
-      const needsTranslation = hasNonEnglishContent(m.text);
-      const translateLink = needsTranslation ? 
-        `<div class="mt-1">
-          <span class="sc-adm-tr translate-link" data-target="${textId}" data-state="original">
-            Translate to English
-          </span>
-        </div>` : '';
-      
-      return `
-        <div class="d-flex ${isAdmin ? 'justify-content-start' : 'justify-content-end'}">
-          <div class="message-bubble ${messageClass}">
-            <div class="message-meta">
-              <i class="fas fa-${isAdmin ? 'user-shield' : 'user'} mr-1"></i>
-              ${role} • ${timestamp}
-            </div>
-            <div id="${textId}" data-original="${esc(m.text)}">${esc(m.text)}</div>
-            ${translateLink}
-          </div>
-        </div>
-      `;
-    }).join("");
-
     const messagesContainer = `
       <div class="ticket-messages">
-        ${messagesHtml || '<div class="text-center text-muted"><i class="fas fa-comments fa-2x mb-2"></i><br>No messages yet</div>'}
+        <div class="text-center text-muted sc-thread-empty"${msgs.length ? ' style="display:none"' : ''}>
+          <i class="fas fa-comments fa-2x mb-2"></i><br>No messages yet
+        </div>
       </div>
     `;
 
-    const replySection = ticket.status === 'open' ? `
+    const replySection = ticket.status === 'open' && !ticket.archived ? `
       <div class="reply-section">
         <div class="input-group">
           <div class="input-group-prepend">
@@ -169,40 +257,102 @@
       </div>
     ` : `
       <div class="ticket-closed">
-        <i class="fas fa-lock mr-2"></i>This ticket has been closed
+        <i class="fas fa-lock mr-2"></i>This ticket has been ${ticket.archived ? 'archived' : 'closed'}
       </div>
     `;
 
     detail.innerHTML = header + messagesContainer + replySection;
     
-    // Auto-scroll to bottom of messages
-    const messagesDiv = detail.querySelector('.ticket-messages');
-    if (messagesDiv) {
-      messagesDiv.scrollTop = messagesDiv.scrollHeight;
-    }
+    const box = detail.querySelector('.ticket-messages');
+    view = {
+      id: ticket.id,
+      status: ticket.status,
+      archived: !!ticket.archived,
+      box: box,
+      thread: createThreadWindow(box, bubbleHTML)
+    };
+    view.thread.update(msgs, true);
   }
 
-  async function openTicket(id) {
-    // Show loading state
-    detail.innerHTML = `
-      <div class="d-flex align-items-center justify-content-center" style="height: 400px;">
-        <div class="text-center">
-          <div class="spinner-border text-primary" role="status">
-            <span class="sr-only">Loading...</span>
+  function bubbleHTML(m) {
+    const isAdmin = m.sender_role === "admin";
+    let role = isAdmin ? "Admin" : "User";
+    
+    // Show username and team for user messages
+    if (!isAdmin && m.sender_name) {
+      role = m.sender_name;
+      if (m.sender_team) {
+        role = `${m.sender_name} (Team ${m.sender_team})`;
+      }
+    }
+    
+    const messageClass = isAdmin ? "message-admin" : "message-user";
+    const textId = `adm-b-${m.id || (Math.random()+"").slice(2)}`;
+    
+    const timestamp = formatDate(m.created);
+    
+    // Only show translate link if content needs translation
+    const translateLink = needsTranslation(m) ? 
+      `<div class="mt-1">
+        <span class="sc-adm-tr translate-link" data-target="${textId}" data-state="original">
+          Translate to English
+        </span>
+      </div>` : '';
+    
+    // Long messages arrive as a preview; the rest is fetched on demand
+    const fullLink = m.truncated ?
+      `<div class="mt-1">
+        <span class="sc-adm-full translate-link" data-target="${textId}" data-message="${m.id}">
+          Load full message (${Number(m.full_length).toLocaleString()} characters)
+        </span>
+      </div>` : '';
+    
+    return `
+      <div class="d-flex ${isAdmin ? 'justify-content-start' : 'justify-content-end'}" data-mid="${m.id}">
+        <div class="message-bubble ${messageClass}">
+          <div class="message-meta">
+            <i class="fas fa-${isAdmin ? 'user-shield' : 'user'} mr-1"></i>
+            ${role} • ${timestamp}
           </div>
-          <p class="mt-2 text-muted">Loading ticket...</p>
+          <div id="${textId}" data-original="${esc(m.text)}">${esc(m.text)}</div>
+          ${fullLink}
+          ${translateLink}
         </div>
       </div>
     `;
+  }
+
+  async function openTicket(id, archived = false) {
+    // Refreshing the open thread keeps it on screen and appends; anything else shows a spinner
+    const refreshing = view && String(view.id) === String(id) && view.archived === archived &&
+      detail.contains(view.box);
+    if (!refreshing) {
+      view = null;
+      detail.innerHTML = `
+        <div class="d-flex align-items-center justify-content-center" style="height: 400px;">
+          <div class="text-center">
+            <div class="spinner-border text-primary" role="status">
+              <span class="sr-only">Loading...</span>
+            </div>
+            <p class="mt-2 text-muted">Loading ticket...</p>
+          </div>
+        </div>
+      `;
+    }
 
     try {
-      const r = await fetch(`/support/admin/ticket/${encodeURIComponent(id)}`, { 
+      // Archived ids can be handed out again, so archived copies are asked for explicitly
+      const base = archived ? "/support/admin/archive" : "/support/admin/ticket";
+      const r = await fetch(`${base}/${encodeURIComponent(id)}?compact=1`, { 
         credentials: "same-origin" 
       });
       
       if (!r.ok) throw new Error("load");
       const d = await r.json();
       renderThread(d.ticket);
+      // The server moved our read cursor when it served the thread
+      const badge = document.querySelector(`[data-open-ticket="${id}"] .notification-badge`);
+      if (badge) badge.remove();
     } catch {
       detail.innerHTML = `
         <div class="card-body d-flex align-items-center justify-content-center">
@@ -227,6 +377,7 @@
         credentials: "same-origin"
       });
       
+      if (r.status === 429) return null; // Rate limited - let the admin retry later
       if (!r.ok) throw new Error(`HTTP ${r.status}`);
       
       const d = await r.json();
@@ -248,6 +399,14 @@
 
   // Delegated clicks from the ticket list
   document.addEventListener("click", (e) => {
+    // Selection checkboxes must not open the ticket
+    if (e.target.closest(".sc-select")) return;
+    const archivedBtn = e.target.closest("[data-open-archived]");
+    if (archivedBtn) {
+      e.preventDefault();
+      openTicket(archivedBtn.getAttribute("data-open-archived"), true);
+      return;
+    }
     const btn = e.target.closest("[data-open-ticket]");
     if (btn) {
       e.preventDefault();
@@ -269,8 +428,34 @@
     }
   });
 
+  async function loadFullMessage(link, bubble) {
+    link.textContent = "Loading...";
+    try {
+      const r = await fetch(`/support/message/${encodeURIComponent(link.getAttribute("data-message"))}/full`, {
+        credentials: "same-origin"
+      });
+      const d = await r.json();
+      if (!r.ok || !d.ok) throw new Error(d.error || `HTTP ${r.status}`);
+      bubble.textContent = d.text;
+      bubble.setAttribute("data-original", d.text);
+      link.parentElement.remove();
+    } catch (error) {
+      console.error("Failed to load full message:", error);
+      link.textContent = "Load full message (failed, click to retry)";
+    }
+  }
+
   // All other event handlers remain the same...
   detail.addEventListener("click", async (e) => {
+    // Expand a long message from its preview
+    const full = e.target.closest(".sc-adm-full");
+    if (full) {
+      e.preventDefault();
+      const bubble = document.getElementById(full.getAttribute("data-target"));
+      if (bubble) await loadFullMessage(full, bubble);
+      return;
+    }
+    
     // Handle translation
     const tr = e.target.closest(".sc-adm-tr");
     if (tr) {
@@ -287,7 +472,9 @@
         
         const translated = await translateText(original, "en");
         
-        if (translated !== original && translated.trim() !== original.trim()) {
+        if (translated === null) {
+          tr.textContent = "Translate to English (rate limited, retry shortly)";
+        } else if (translated !== original && translated.trim() !== original.trim()) {
           bubble.textContent = translated;
           tr.textContent = "Show original";
           tr.setAttribute("data-state","translated");
@@ -331,6 +518,10 @@
         });
         
         const d = await r.json().catch(()=>({}));
+        if (r.status === 413) {
+          hint.innerHTML = `<i class="fas fa-exclamation-triangle mr-1 text-danger"></i>${esc(d.error || "Message too long.")}`;
+          return;
+        }
         if (!r.ok || d.ok === false) throw new Error("send");
         
         input.value = "";
@@ -418,6 +609,211 @@
     }
   });
 
+  // ---------- Bulk actions ----------
+  async function bulkRequest(params) {
+    const nonce = await getNonce();
+    params.set("nonce", nonce);
+    const r = await fetch("/support/admin/bulk", {
+      method: "POST",
+      headers: {"Content-Type":"application/x-www-form-urlencoded"},
+      body: params.toString(),
+      credentials: "same-origin"
+    });
+    const d = await r.json().catch(()=>({}));
+    if (!r.ok || d.ok === false) throw new Error(d.error || "bulk");
+    return d;
+  }
+
+  const selectAll = document.querySelector("#sc-select-all");
+  if (selectAll) {
+    selectAll.addEventListener("change", () => {
+      document.querySelectorAll(".sc-select").forEach(cb => { cb.checked = selectAll.checked; });
+    });
+  }
+
+  const bulkApply = document.querySelector("#sc-bulk-apply");
+  if (bulkApply) {
+    bulkApply.addEventListener("click", async () => {
+      const ids = Array.from(document.querySelectorAll(".sc-select:checked")).map(cb => cb.value);
+      if (!ids.length) {
+        alert("Select at least one ticket first.");
+        return;
+      }
+
+      const [action, status] = document.querySelector("#sc-bulk-action").value.split(":");
+      const warning = action === "delete" ?
+        `PERMANENTLY DELETE ${ids.length} ticket(s) and all their messages?\n\nThis action CANNOT be undone!` :
+        `Apply "${status || action}" to ${ids.length} ticket(s)?`;
+      if (!confirm(warning)) return;
+
+      const params = new URLSearchParams({ action, ticket_ids: ids.join(",") });
+      if (status) params.set("status", status);
+
+      bulkApply.disabled = true;
+      try {
+        await bulkRequest(params);
+        window.location.reload();
+      } catch {
+        alert("Bulk action failed. Please try again.");
+        bulkApply.disabled = false;
+      }
+    });
+  }
+
+  const closeStale = document.querySelector("#sc-close-stale");
+  if (closeStale) {
+    closeStale.addEventListener("click", async () => {
+      const hours = prompt("Close open tickets with no activity for how many hours?", "24");
+      if (!hours || isNaN(parseFloat(hours)) || parseFloat(hours) <= 0) return;
+
+      closeStale.disabled = true;
+      try {
+        const d = await bulkRequest(new URLSearchParams({ action: "close", filter_status: "open", inactive_hours: hours }));
+        alert(`Closed ${d.affected} stale ticket(s).`);
+        window.location.reload();
+      } catch {
+        alert("Failed to close stale tickets. Please try again.");
+        closeStale.disabled = false;
+      }
+    });
+  }
+
+  // ---------- Message search ----------
+  const searchForm = document.querySelector("#sc-search-form");
+  const searchResults = document.querySelector("#sc-search-results");
+  let searchPage = 1;
+
+  async function runSearch(page) {
+    const q = document.querySelector("#sc-search-q").value.trim();
+    if (!q) {
+      searchResults.style.display = "none";
+      return;
+    }
+    searchPage = page;
+
+    const params = new URLSearchParams({ q, page, compact: 1 });
+    const role = document.querySelector("#sc-search-role").value;
+    const team = document.querySelector("#sc-search-team").value;
+    const from = document.querySelector("#sc-search-from").value;
+    const to = document.querySelector("#sc-search-to").value;
+    if (role) params.set("role", role);
+    if (team) params.set("team_id", team);
+    if (from) params.set("from", from);
+    if (to) params.set("to", to);
+
+    searchResults.style.display = "block";
+    searchResults.innerHTML = '<div class="text-muted small"><i class="fas fa-spinner fa-spin mr-1"></i>Searching...</div>';
+
+    try {
+      const r = await fetch(`/support/admin/search?${params}`, { credentials: "same-origin" });
+      const d = await r.json();
+      if (!r.ok || d.ok === false) throw new Error(d.error || "search");
+
+      const results = unpackRows(d.results);
+      if (!results.length) {
+        searchResults.innerHTML = '<div class="text-muted small">No messages found.</div>';
+        return;
+      }
+
+      const hits = results.map(m => {
+        const who = m.sender_role === "admin" ? `Admin ${esc(m.sender_name || "")}` : esc(m.sender_name || "User");
+        const team = m.team_name ? ` (Team ${esc(m.team_name)})` : "";
+        const text = m.text.length > 240 ? m.text.slice(0, 240) + "…" : m.text;
+        return `
+          <div class="search-hit" data-open-ticket="${m.ticket_id}">
+            <div class="small text-muted">
+              <strong class="text-primary">#${m.ticket_id}</strong>
+              ${esc(m.user_name || "")}${team} • ${who} • ${formatDate(m.created)}
+            </div>
+            <div class="small">${esc(text)}</div>
+          </div>
+        `;
+      }).join("");
+
+      const pager = `
+        <div class="d-flex justify-content-between mt-2">
+          <button class="btn btn-outline-secondary btn-sm" id="sc-search-prev" ${d.page > 1 ? "" : "disabled"}>Prev</button>
+          <small class="text-muted align-self-center">Page ${d.page}</small>
+          <button class="btn btn-outline-secondary btn-sm" id="sc-search-next" ${d.has_more ? "" : "disabled"}>Next</button>
+        </div>
+      `;
+      searchResults.innerHTML = hits + pager;
+    } catch {
+      searchResults.innerHTML = '<div class="text-danger small">Search failed. Please try again.</div>';
+    }
+  }
+
+  if (searchForm) {
+    searchForm.addEventListener("submit", (e) => {
+      e.preventDefault();
+      runSearch(1);
+    });
+
+    searchResults.addEventListener("click", (e) => {
+      if (e.target.closest("#sc-search-prev")) runSearch(searchPage - 1);
+      if (e.target.closest("#sc-search-next")) runSearch(searchPage + 1);
+    });
+  }
+
+  // ---------- Archived tickets ----------
+  const archiveToggle = document.querySelector("#sc-archive-toggle");
+  const archiveCard = document.querySelector("#sc-archive");
+  const archiveList = document.querySelector("#sc-archive-list");
+  let archivePage = 1;
+
+  async function loadArchive(page) {
+    archivePage = page;
+    archiveList.innerHTML = '<div class="text-muted small"><i class="fas fa-spinner fa-spin mr-1"></i>Loading...</div>';
+
+    try {
+      const r = await fetch(`/support/admin/archive?page=${page}`, { credentials: "same-origin" });
+      const d = await r.json();
+      if (!r.ok || d.ok === false) throw new Error(d.error || "archive");
+
+      if (!d.tickets.length) {
+        archiveList.innerHTML = '<div class="text-muted small">No archived tickets.</div>';
+        return;
+      }
+
+      const rows = d.tickets.map(t => `
+        <div class="archive-hit" data-open-archived="${t.id}">
+          <div class="small">
+            <strong class="text-primary">#${t.id}</strong>
+            ${esc(t.user_name || `user ${t.user_id}`)}
+            <span class="badge badge-secondary ml-1">${esc(t.status)}</span>
+          </div>
+          <div class="small text-muted">
+            Last activity ${formatDate(t.updated)} • archived ${formatDate(t.archived)}
+          </div>
+        </div>
+      `).join("");
+
+      const pager = `
+        <div class="d-flex justify-content-between mt-2">
+          <button class="btn btn-outline-secondary btn-sm" id="sc-archive-prev" ${d.page > 1 ? "" : "disabled"}>Prev</button>
+          <small class="text-muted align-self-center">Page ${d.page}</small>
+          <button class="btn btn-outline-secondary btn-sm" id="sc-archive-next" ${d.has_more ? "" : "disabled"}>Next</button>
+        </div>
+      `;
+      archiveList.innerHTML = rows + pager;
+    } catch {
+      archiveList.innerHTML = '<div class="text-danger small">Failed to load archived tickets.</div>';
+    }
+  }
+
+  if (archiveToggle && archiveCard) {
+    archiveToggle.addEventListener("click", () => {
+      const show = archiveCard.style.display === "none";
+      archiveCard.style.display = show ? "block" : "none";
+      if (show) loadArchive(1);
+    });
+
+    archiveList.addEventListener("click", (e) => {
+      if (e.target.closest("#sc-archive-prev")) loadArchive(archivePage - 1);
+      if (e.target.closest("#sc-archive-next")) loadArchive(archivePage + 1);
+    });
+  }
+
   // Handle Enter key in reply input
   detail.addEventListener("keydown", (e) => {
     if (e.target.id === "sc-reply" && e.key === "Enter") {
@@ -428,6 +824,20 @@
     }
   });
 
+  // Ticket list timestamps are rendered as epoch ms by the template
+  document.querySelectorAll('.format-date').forEach(function(element) {
+    element.textContent = formatDate(element.textContent.trim());
+  });
+  const firstClockIcon = document.querySelector('.ticket-item .fa-clock');
+  if (firstClockIcon && DISPLAY_TZ) {
+    // Small indicator showing the timezone being used
+    const timezoneIndicator = document.createElement('small');
+    timezoneIndicator.textContent = ` (${DISPLAY_TZ})`;
+    timezoneIndicator.className = 'text-muted';
+    timezoneIndicator.style.fontSize = '0.65rem';
+    firstClockIcon.parentElement.appendChild(timezoneIndicator);
+  }
+
   // Optional: automatically open a ticket if URL has ticket_id parameter
   const urlParams = new URLSearchParams(window.location.search);
   const preselectedTicket = urlParams.get("ticket_id");
@@ -1,5 +1,8 @@
-/* support.js — Updated with consistent UTC+8 timezone formatting */
+/* support.js — Compact payloads, client-side timezone formatting and cross-tab polling */
 (function () {
+  // Display timezone comes from the injecting <script data-timezone> tag
+  const DISPLAY_TZ = (document.currentScript && document.currentScript.dataset.timezone) || undefined;
+
   // Only on /challenges and prevent duplicate injections
   if (!location.pathname.startsWith("/challenges")) return;
   if (document.getElementById("sw-widget")) return;
@@ -65,31 +68,106 @@
   let unreadCount = 0;
   let isPolling = false;
   let lastUnreadCount = 0;
+  let sending = false; // One POST in flight at a time
+
+  // ---------- Cross-tab coordination ----------
+  // Tabs elect one leader that does all polling and relays results to the
+  // others over a BroadcastChannel, so per-user request volume stays constant
+  // however many challenge tabs are open.
+  const TAB_ID = Math.random().toString(36).slice(2);
+  const LEADER_KEY = "sw-support-leader";
+  const LEASE_MS = 8000;
+  const PANEL_TTL_MS = 10000;
+  const POLL_MS = 4000;
+  const channel = ("BroadcastChannel" in window) ? new BroadcastChannel("sw-support-chat") : null;
+  let isLeader = !channel; // Without a channel every tab polls for itself
+  const openPanels = new Map(); // tab id -> last "panel open" heartbeat
+  let lastPollAt = 0;
+
+  function relay(type, data) {
+    if (channel) channel.postMessage({ type, from: TAB_ID, data });
+  }
+
+  function panelIsOpen() {
+    return panel.getAttribute("aria-hidden") !== "true";
+  }
+
+  function anyPanelOpen() {
+    if (panelIsOpen()) return true;
+    const now = Date.now();
+    for (const [id, seen] of openPanels) {
+      if (now - seen < PANEL_TTL_MS) return true;
+      openPanels.delete(id);
+    }
+    return false;
+  }
+
+  function electLeader() {
+    if (!channel) return;
+
+    if (navigator.locks && navigator.locks.request) {
+      // Held for the lifetime of the tab, then handed to the next waiting tab
+      navigator.locks.request(LEADER_KEY, () => new Promise(() => { isLeader = true; }));
+      return;
+    }
+
+    // Fallback: heartbeat lease in localStorage
+    const renew = () => {
+      try {
+        const now = Date.now();
+        const lease = JSON.parse(localStorage.getItem(LEADER_KEY) || "null");
+        if (!lease || lease.id === TAB_ID || now - lease.ts > LEASE_MS) {
+          localStorage.setItem(LEADER_KEY, JSON.stringify({ id: TAB_ID, ts: now }));
+        }
+        const current = JSON.parse(localStorage.getItem(LEADER_KEY) || "null");
+        isLeader = !!current && current.id === TAB_ID;
+      } catch {
+        isLeader = true;
+      }
+    };
+    renew();
+    setInterval(renew, LEASE_MS / 4);
+    window.addEventListener("beforeunload", () => {
+      try { if (isLeader) localStorage.removeItem(LEADER_KEY); } catch {}
+    });
+  }
 
   // ---------- Helpers ----------
   function esc(s) {
     return (s || "").replace(/[&<>"]/g, (c) => ({ "&":"&amp;", "<":"&lt;", ">":"&gt;", "\"":"&quot;" }[c]));
   }
 
-  // UTC+8 date formatting function - server already sends converted timestamps
-  function formatDateUTC8(dateStr) {
-    if (!dateStr) return '';
+  // Built once; falls back to the browser's zone if the configured one is unknown
+  const dateFormat = (() => {
+    const opts = { hour12: false, month: '2-digit', day: '2-digit', hour: '2-digit', minute: '2-digit' };
     try {
-      // Server already sends UTC+8 converted timestamps, so just format
-      const date = new Date(dateStr);
-      return date.toLocaleString('en-GB', {
-        hour12: false,
-        month: '2-digit',
-        day: '2-digit',
-        hour: '2-digit',
-        minute: '2-digit'
-      }).replace(',', '');
+      return new Intl.DateTimeFormat('en-GB', { ...opts, timeZone: DISPLAY_TZ });
+    } catch {
+      return new Intl.DateTimeFormat('en-GB', opts);
+    }
+  })();
+
+  // Server sends epoch milliseconds (UTC)
+  function formatDate(ts) {
+    if (ts === null || ts === undefined || ts === '') return '';
+    try {
+      return dateFormat.format(new Date(ts)).replace(',', '');
     } catch (e) {
       console.error('Date formatting error:', e);
-      return dateStr;
+      return String(ts);
     }
   }
 
+  // Message lists arrive column-encoded ({fields, rows}) to keep polls small
+  function unpackRows(list) {
+    if (!list || Array.isArray(list)) return list || [];
+    return list.rows.map(row => {
+      const obj = {};
+      list.fields.forEach((f, i) => { obj[f] = row[i]; });
+      return obj;
+    });
+  }
+
   function hasNonEnglishContent(text) {
     if (!text) return false;
     
@@ -161,6 +239,7 @@
         const d = await r.json();
         if (d.ok) {
           clearNotifications();
+          relay("read");
         }
       }
     } catch (error) {
@@ -168,39 +247,136 @@
     }
   }
 
+  function applyUnread(count, notify) {
+    // Show browser notification for NEW messages only
+    if (notify && count > lastUnreadCount && count > 0 && "Notification" in window && Notification.permission === "granted") {
+      const newMessages = count - lastUnreadCount;
+      new Notification("Support Chat", {
+        body: `You have ${newMessages} new message${newMessages > 1 ? 's' : ''} from admin`,
+        icon: "/themes/core/static/img/logo.png",
+        tag: "support-chat"
+      });
+    }
+
+    updateNotification(count);
+    lastUnreadCount = count;
+  }
+
   async function checkUnreadCount() {
-    // Only check if panel is closed
-    if (panel.getAttribute("aria-hidden") !== "true") return;
+    // Only check if no tab has the panel open
+    if (anyPanelOpen()) return;
     
     try {
       const r = await fetch("/support/unread_count", { credentials: "same-origin" });
       if (r.ok) {
         const d = await r.json();
         const count = d.unread_count || 0;
-        
-        // Show browser notification for NEW messages only
-        if (count > lastUnreadCount && count > 0 && "Notification" in window && Notification.permission === "granted") {
-          const newMessages = count - lastUnreadCount;
-          new Notification("Support Chat", {
-            body: `You have ${newMessages} new message${newMessages > 1 ? 's' : ''} from admin`,
-            icon: "/themes/core/static/img/logo.png",
-            tag: "support-chat"
-          });
-        }
-        
-        updateNotification(count);
-        lastUnreadCount = count;
+        applyUnread(count, true);
+        relay("unread", count);
       }
     } catch (error) {
       console.error("Failed to check unread count:", error);
     }
   }
 
+  // Language detection per message id; message text never changes
+  const langCache = new Map();
+  function needsTranslation(m) {
+    if (!langCache.has(m.id)) langCache.set(m.id, hasNonEnglishContent(m.text));
+    return langCache.get(m.id);
+  }
+
+  // Keyed, windowed message list: bubbles are appended by message id instead of
+  // rebuilding the list, and long threads keep only WINDOW bubbles in the DOM,
+  // sliding by CHUNK as the reader scrolls toward either edge
+  function createThreadWindow(box, bubble) {
+    const WINDOW = 150, CHUNK = 50, EDGE = 40;
+    let msgs = [], ids = new Set(), start = 0, end = 0, queued = false;
+
+    const nodes = () => Array.from(box.querySelectorAll(":scope > [data-mid]"));
+    const html = (from, to) => msgs.slice(from, to).map(m => bubble(m)).join("");
+
+    function dropTop(n) {
+      if (n <= 0) return;
+      const before = box.scrollHeight;
+      nodes().slice(0, n).forEach(el => el.remove());
+      box.scrollTop -= before - box.scrollHeight;
+      start += n;
+    }
+
+    function dropBottom(n) {
+      if (n <= 0) return;
+      nodes().slice(-n).forEach(el => el.remove());
+      end -= n;
+    }
+
+    function showLatest() {
+      nodes().forEach(el => el.remove());
+      start = Math.max(0, msgs.length - WINDOW);
+      end = msgs.length;
+      box.insertAdjacentHTML("beforeend", html(start, end));
+      box.scrollTop = box.scrollHeight;
+    }
+
+    function slide() {
+      if (box.scrollTop < EDGE && start > 0) {
+        const from = Math.max(0, start - CHUNK);
+        const before = box.scrollHeight;
+        nodes()[0].insertAdjacentHTML("beforebegin", html(from, start));
+        box.scrollTop += box.scrollHeight - before;
+        start = from;
+        dropBottom(end - start - WINDOW);
+      } else if (box.scrollHeight - box.scrollTop - box.clientHeight < EDGE && end < msgs.length) {
+        const to = Math.min(msgs.length, end + CHUNK);
+        box.insertAdjacentHTML("beforeend", html(end, to));
+        end = to;
+        dropTop(end - start - WINDOW);
+      }
+    }
+
+    box.addEventListener("scroll", () => {
+      if (queued) return;
+      queued = true;
+      requestAnimationFrame(() => { queued = false; slide(); });
+    });
+
+    return {
+      get size() { return msgs.length; },
+      has(id) { return ids.has(id); },
+
+      // Append messages whose id is new and return them. If the reader has
+      // scrolled back through history they stay put unless `follow` is set.
+      update(list, follow) {
+        const fresh = list.filter(m => !ids.has(m.id));
+        if (!fresh.length) return fresh;
+        const atTail = end === msgs.length;
+        fresh.forEach(m => { ids.add(m.id); msgs.push(m); });
+        if (!atTail && !follow) return fresh;
+        if (!atTail || msgs.length - end > WINDOW) {
+          showLatest();
+          return fresh;
+        }
+        box.insertAdjacentHTML("beforeend", html(end, msgs.length));
+        end = msgs.length;
+        dropTop(end - start - WINDOW);
+        box.scrollTop = box.scrollHeight;
+        return fresh;
+      },
+
+      reset() {
+        nodes().forEach(el => el.remove());
+        msgs = [];
+        ids = new Set();
+        start = end = 0;
+      }
+    };
+  }
+
   function bubbleHTML(m, isNewMessage = false) {
     const mine = m.sender_role !== "admin";
     const cls  = mine ? "sw-user" : "sw-admin";
     const who  = mine ? "You" : "Admin";
-    const ts   = formatDateUTC8(m.created); // Use UTC+8 formatting
+    const ts   = formatDate(m.created);
     const id   = `b-${m.id || (Math.random()+"").slice(2)}`;
     const txt  = esc(m.text);
     
@@ -208,35 +384,48 @@
     const animClass = isNewMessage ? ' sw-new-message' : '';
     
     // Only show translate link if text contains non-English characters or common foreign words
-    const needsTranslation = hasNonEnglishContent(m.text);
-    const translateLink = needsTranslation ? 
+    const translateLink = needsTranslation(m) ? 
       `<div class="sw-small"><a href="#" class="sw-toggle-tr" data-target="${id}" data-state="original">Translate to English</a></div>` : '';
     
+    // Long pastes arrive as a preview; the rest is fetched on demand
+    const fullLink = m.truncated ?
+      `<div class="sw-small"><a href="#" class="sw-load-full" data-target="${id}" data-message="${m.id}">Show full message (${Number(m.full_length).toLocaleString()} characters)</a></div>` : '';
+    
     return `
-      <div class="sw-msg${animClass}" data-id="${m.id || ""}" data-role="${m.sender_role}">
+      <div class="sw-msg${animClass}" data-id="${m.id || ""}" data-mid="${m.id || ""}" data-role="${m.sender_role}">
         <div class="sw-meta">${who} <span style="opacity:.7">${ts}</span></div>
         <div class="sw-bubble ${cls}" id="${id}" data-original="${txt}">${txt}</div>
+        ${fullLink}
         ${translateLink}
       </div>
     `;
   }
 
+  // Bubbles newer than this id get the highlight animation while it is set
+  let highlightAfter = 0;
+  const thread = createThreadWindow(list, m => bubbleHTML(m, !!highlightAfter && m.id > highlightAfter));
+  let threadTicket = null;
+
   function render(messages, highlightNew = false) {
-    const oldLastSeenId = lastSeenMsgId;
-    list.innerHTML = "";
+    messages = messages || [];
+    
+    // A new ticket, or messages removed server-side: start the list over
+    if (threadTicket !== ticketId || messages.length < thread.size) {
+      thread.reset();
+      threadTicket = ticketId;
+    }
     
-    if (!messages || !messages.length) {
+    if (!messages.length) {
       empty.style.display = "block";
       return;
     }
     
     empty.style.display = "none";
-    messages.forEach(m => {
-      const isNewMessage = highlightNew && oldLastSeenId && m.id > oldLastSeenId;
-      list.insertAdjacentHTML("beforeend", bubbleHTML(m, isNewMessage));
-    });
+    highlightAfter = highlightNew ? lastSeenMsgId : 0;
+    // Jump to the newest message when it is one the player just sent
+    thread.update(messages, messages.some(m => m.sender_role !== "admin" && !thread.has(m.id)));
+    highlightAfter = 0;
     
-    list.scrollTop = list.scrollHeight;
     const last = messages[messages.length - 1];
     lastSeenMsgId = last && last.id ? last.id : lastSeenMsgId;
   }
@@ -257,6 +446,7 @@
         credentials: "same-origin"
       });
       
+      if (r.status === 429) return null; // Rate limited - let the user retry later
       if (!r.ok) throw new Error(`HTTP ${r.status}`);
       
       const d = await r.json();
@@ -278,19 +468,20 @@
 
   async function loadTicket() {
     try {
-      const r = await fetch("/support/ticket", { credentials: "same-origin" });
+      const r = await fetch("/support/ticket?compact=1", { credentials: "same-origin" });
       if (r.status === 401) {
         list.innerHTML = `<div class="sw-small">Please log in to use support.</div>`;
         return;
       }
       const d = await r.json();
+      relay("ticket", d);
       
       // Check if user has a ticket
       hasTicket = d.ticket_id !== null;
       ticketId = d.ticket_id;
       
       if (hasTicket) {
-        render(d.messages || []);
+        render(unpackRows(d.messages));
         
         // Update unread count from server response - but only if panel is closed
         const serverUnreadCount = d.unread_admin_count || 0;
@@ -307,63 +498,82 @@
     }
   }
 
-  function startPolling() {
-    if (pollTimer) clearInterval(pollTimer);
-    isPolling = true;
+  function applyTicket(d, notify) {
+    // Update ticket status
+    hasTicket = d.ticket_id !== null;
+    ticketId = d.ticket_id;
     
-    pollTimer = setInterval(async () => {
-      try {
-        const r = await fetch("/support/ticket", { credentials: "same-origin" });
-        const d = await r.json();
-        
-        // Update ticket status
-        hasTicket = d.ticket_id !== null;
-        ticketId = d.ticket_id;
-        
-        if (!hasTicket) {
-          // No ticket yet, no messages to show
-          return;
-        }
-        
-        const msgs = d.messages || [];
-        if (!msgs.length) return;
-        
-        const last = msgs[msgs.length - 1];
-        const panelClosed = panel.getAttribute("aria-hidden") === "true";
-        
-        // Update messages if there are changes
-        if (last && last.id !== lastSeenMsgId) {
-          render(msgs, panelClosed);
-          
-          // If panel is closed and there are new admin messages, show notification
-          if (panelClosed) {
-            const serverUnreadCount = d.unread_admin_count || 0;
-            if (serverUnreadCount > lastUnreadCount) {
-              // Show browser notification for new messages
-              if ("Notification" in window && Notification.permission === "granted") {
-                new Notification("Support Chat", {
-                  body: "Admin replied to your support ticket",
-                  icon: "/themes/core/static/img/logo.png",
-                  tag: "support-chat"
-                });
-              }
-            }
-            updateNotification(serverUnreadCount);
-            lastUnreadCount = serverUnreadCount;
+    if (!hasTicket) {
+      // No ticket yet, no messages to show
+      return;
+    }
+    
+    const msgs = unpackRows(d.messages);
+    if (!msgs.length) return;
+    
+    const last = msgs[msgs.length - 1];
+    const panelClosed = !panelIsOpen();
+    
+    // Update messages if there are changes
+    if (last && last.id !== lastSeenMsgId) {
+      render(msgs, panelClosed);
+      
+      // If panel is closed and there are new admin messages, show notification
+      if (panelClosed) {
+        const serverUnreadCount = d.unread_admin_count || 0;
+        if (notify && serverUnreadCount > lastUnreadCount) {
+          // Show browser notification for new messages
+          if ("Notification" in window && Notification.permission === "granted") {
+            new Notification("Support Chat", {
+              body: "Admin replied to your support ticket",
+              icon: "/themes/core/static/img/logo.png",
+              tag: "support-chat"
+            });
           }
         }
-      } catch (error) {
-        console.error("Polling error:", error);
+        updateNotification(serverUnreadCount);
+        lastUnreadCount = serverUnreadCount;
       }
-    }, 4000);
+    }
+  }
+
+  async function pollTicket() {
+    try {
+      const r = await fetch("/support/ticket?compact=1", { credentials: "same-origin" });
+      const d = await r.json();
+      applyTicket(d, true);
+      relay("ticket", d);
+    } catch (error) {
+      console.error("Polling error:", error);
+    }
+  }
+
+  // The leader polls on its own timer and on every open-panel heartbeat. A
+  // hidden leader's timers get throttled to once a minute, but channel
+  // messages are not, so the visible tab's heartbeat keeps the chat live.
+  function pollIfDue() {
+    if (Date.now() - lastPollAt < POLL_MS - 500) return;
+    lastPollAt = Date.now();
+    pollTicket();
+  }
+
+  function startPolling() {
+    if (pollTimer) clearInterval(pollTimer);
+    isPolling = true;
+    
+    // Every tab heartbeats its open panel; only the leader hits the server
+    pollTimer = setInterval(() => {
+      if (panelIsOpen()) relay("panel", { open: true });
+      if (isLeader && anyPanelOpen()) pollIfDue();
+    }, POLL_MS);
   }
 
   function startNotificationChecking() {
     if (notificationTimer) clearInterval(notificationTimer);
     
-    // Check for unread messages every 15 seconds when chat is closed
+    // Check for unread messages every 15 seconds when chat is closed everywhere
     notificationTimer = setInterval(() => {
-      if (panel.getAttribute("aria-hidden") === "true" && hasTicket) {
+      if (isLeader && hasTicket && !anyPanelOpen()) {
         checkUnreadCount();
       }
     }, 15000);
@@ -374,6 +584,7 @@
     panel.setAttribute("aria-hidden", "false");
     panel.style.display = "flex";
     openBtn.classList.add("hidden");
+    relay("panel", { open: true });
     
     // Clear notifications when panel is opened
     clearNotifications();
@@ -391,12 +602,7 @@
     panel.setAttribute("aria-hidden", "true");
     panel.style.display = "none";
     openBtn.classList.remove("hidden");
-    
-    if (pollTimer) {
-      clearInterval(pollTimer);
-      pollTimer = null;
-      isPolling = false;
-    }
+    relay("panel", { open: false });
   }
 
   // ---------- Events ----------
@@ -409,7 +615,6 @@
     
     openPanel();
     await loadTicket();
-    startPolling();
     
     // Request notification permission
     if ("Notification" in window && Notification.permission === "default") {
@@ -435,10 +640,30 @@
     e.stopPropagation();
   });
 
+  // Hold the send button while the server asks us to back off (HTTP 429)
+  function backOff(seconds) {
+    let remaining = Math.max(1, Math.ceil(seconds));
+    sendBtn.disabled = true;
+    hint.style.color = "#ffb3b3";
+    const tick = () => {
+      if (remaining <= 0) {
+        sendBtn.disabled = false;
+        hint.textContent = "Ask your questions, admin will reply here.";
+        hint.style.color = "";
+        return;
+      }
+      hint.textContent = `You're sending too fast. Try again in ${remaining}s.`;
+      remaining -= 1;
+      setTimeout(tick, 1000);
+    };
+    tick();
+  }
+
   sendBtn.addEventListener("click", async () => {
     const text = input.value.trim();
-    if (!text) return;
+    if (!text || sending || sendBtn.disabled) return;
     
+    sending = true;
     const nonce = await getNonce();
     try {
       const r = await fetch("/support/message", {
@@ -448,8 +673,12 @@
         credentials: "same-origin"
       });
       const d = await r.json().catch(() => ({}));
+      if (r.status === 429) {
+        backOff(d.retry_after || Number(r.headers.get("Retry-After")) || 5);
+        return;
+      }
       if (!r.ok || d.ok === false) {
-        hint.textContent = "Failed to send. Try again.";
+        hint.textContent = r.status === 413 && d.error ? d.error : "Failed to send. Try again.";
         hint.style.color = "#ffb3b3";
         return;
       }
@@ -464,6 +693,8 @@
     } catch {
       hint.textContent = "Failed to send (network).";
       hint.style.color = "#ffb3b3";
+    } finally {
+      sending = false;
     }
   });
 
@@ -471,6 +702,31 @@
     if (e.key === "Enter") sendBtn.click();
   });
 
+  // Expand a long message from its preview
+  list.addEventListener("click", async (e) => {
+    const a = e.target.closest(".sw-load-full");
+    if (!a) return;
+    e.preventDefault();
+
+    const bubble = document.getElementById(a.getAttribute("data-target"));
+    if (!bubble) return;
+
+    a.textContent = "Loading...";
+    try {
+      const r = await fetch(`/support/message/${encodeURIComponent(a.getAttribute("data-message"))}/full`, {
+        credentials: "same-origin"
+      });
+      const d = await r.json();
+      if (!r.ok || !d.ok) throw new Error(d.error || `HTTP ${r.status}`);
+      bubble.textContent = d.text;
+      bubble.setAttribute("data-original", d.text);
+      a.parentElement.remove();
+    } catch (error) {
+      console.error("Failed to load full message:", error);
+      a.textContent = "Couldn't load the full message. Try again.";
+    }
+  });
+
   // Per-message toggle (Translate ↔ Original)
   list.addEventListener("click", async (e) => {
     const a = e.target.closest(".sw-toggle-tr");
@@ -489,7 +745,9 @@
       
       const translated = await translateText(original, "en");
       
-      if (translated !== original && translated.trim() !== original.trim()) {
+      if (translated === null) {
+        flipToggle(a, false);
+      } else if (translated !== original && translated.trim() !== original.trim()) {
         bubble.textContent = translated;
         flipToggle(a, true);
       } else {
@@ -501,12 +759,45 @@
     }
   });
 
+  // Results relayed by the leader (or by a tab that just fetched)
+  if (channel) {
+    channel.onmessage = (e) => {
+      const msg = e.data || {};
+      switch (msg.type) {
+        case "panel":
+          if (msg.data && msg.data.open) {
+            openPanels.set(msg.from, Date.now());
+            if (isLeader) pollIfDue();
+          } else {
+            openPanels.delete(msg.from);
+          }
+          break;
+        case "ticket":
+          applyTicket(msg.data || {}, false);
+          break;
+        case "unread":
+          applyUnread(msg.data || 0, false);
+          break;
+        case "read":
+          clearNotifications();
+          break;
+        case "hello":
+          // New tab joined - hand it the last known unread count
+          if (isLeader) relay("unread", lastUnreadCount);
+          break;
+      }
+    };
+  }
+
   // Initialize with CLOSED state and start notification checking
+  electLeader();
   closePanel();
+  startPolling();
   startNotificationChecking();
   
-  // Initial unread count check after a short delay (only if user has ticket)
+  // Initial unread count check after a short delay (leader only; others ask it)
   setTimeout(() => {
-    checkUnreadCount();
+    if (isLeader) checkUnreadCount();
+    else relay("hello");
   }, 2000);
 })();
\ No newline at end of file
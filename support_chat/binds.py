@@ -0,0 +1,75 @@
+# binds.py - Optional dedicated database for the support chat tables
+
+import sqlalchemy as sa
+
+from CTFd.models import db
+
+from .models import (
+    SupportTicket, SupportMessage, UserNotification, AdminReadCursor,
+    SupportCounter, SupportHourlyStat, SupportTicketArchive, SupportMessageArchive,
+)
+
+BIND_KEY = "support_chat"
+
+# Everything the plugin owns moves together: these tables join and
+# INSERT ... SELECT into each other, which only works within one database
+CHAT_MODELS = (
+    SupportTicket, SupportMessage, UserNotification, AdminReadCursor,
+    SupportCounter, SupportHourlyStat, SupportTicketArchive, SupportMessageArchive,
+)
+
+
+class _ChatConnector:
+    """Stands in for Flask-SQLAlchemy's per-bind connector so the bind keeps its own pool settings"""
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def get_engine(self):
+        return self._engine
+
+
+def configure_chat_bind(app):
+    """Route the chat tables to SUPPORT_CHAT_DATABASE_URL when it is set.
+
+    Must run before the first session is created for these tables. Returns the
+    engine, or None when the chat tables stay on CTFd's database.
+    """
+    url = app.config.get("SUPPORT_CHAT_DATABASE_URL")
+    if not url:
+        return None
+
+    options = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=int(app.config.get("SUPPORT_CHAT_DB_POOL_SIZE", 5)),
+            max_overflow=int(app.config.get("SUPPORT_CHAT_DB_MAX_OVERFLOW", 10)),
+            pool_recycle=int(app.config.get("SUPPORT_CHAT_DB_POOL_RECYCLE", 3600)),
+        )
+    engine = sa.create_engine(url, **options)
+
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    binds[BIND_KEY] = url
+    app.config["SQLALCHEMY_BINDS"] = binds
+    app.extensions["sqlalchemy"].connectors[BIND_KEY] = _ChatConnector(engine)
+
+    # Flask-SQLAlchemy routes by table.info["bind_key"], both for ORM queries
+    # and (through the session's table binds) for Core inserts and upserts
+    for model in CHAT_MODELS:
+        model.__table__.info["bind_key"] = BIND_KEY
+    # Sessions pick up table binds when created; drop any opened before this point
+    db.session.remove()
+
+    print(f"[DB] Support chat tables use their own database ({engine.url.drivername}, pool {options.get('pool_size', 'default')})")
+    return engine
+
+
+def chat_connection():
+    """The session's connection for the chat tables; raw SQL must run here, not on db.engine"""
+    return db.session.connection(mapper=SupportTicket.__mapper__)
+
+
+def chat_dialect():
+    # Call the session itself: SQLAlchemy 1.4's scoped_session proxy passes keywords that
+    # Flask-SQLAlchemy 2.x's get_bind does not accept
+    return db.session().get_bind(mapper=SupportTicket.__mapper__).dialect.name
@@ -0,0 +1,211 @@
+# bulk.py - Set-based ticket operations shared by the admin API and maintenance jobs
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from CTFd.models import db
+
+from .models import SupportTicket, SupportMessage, UserNotification, AdminReadCursor
+from .stats import tickets_moving, tickets_leaving, bump, record_messages
+from .upsert import insert_ignore, upsert
+from .storage import message_fields
+
+STATUSES = ("open", "closed", "pending")
+
+
+def ticket_criteria(ticket_ids=None, status=None, inactive_hours=None):
+    """Build SupportTicket filter criteria from explicit ids and/or a filter"""
+    criteria = []
+    if ticket_ids is not None:
+        criteria.append(SupportTicket.id.in_(ticket_ids))
+    if status:
+        criteria.append(SupportTicket.status == status)
+    if inactive_hours:
+        cutoff = datetime.utcnow() - timedelta(hours=inactive_hours)
+        criteria.append(SupportTicket.updated < cutoff)
+    return criteria
+
+
+def lock_tickets(criteria):
+    """SELECT ... FOR UPDATE the matching tickets (no-op on SQLite).
+
+    Write paths lock their tickets before touching anything else, so ticket
+    rows are always locked ahead of notifications, cursors and counters.
+    Returns the ids that still match once locked.
+    """
+    return [
+        row.id for row in db.session.query(SupportTicket.id).filter(*criteria).with_for_update().all()
+    ]
+
+
+def set_status(criteria, status):
+    """Change status for every matching ticket with one UPDATE per table (no commit).
+
+    Closing also clears the player's unread counter for those tickets, since a
+    closed ticket is never shown in the widget again. Returns tickets changed.
+    """
+    now = datetime.utcnow()
+    matched = SupportTicket.query.filter(*criteria).filter(SupportTicket.status != status)
+    lock_tickets(criteria)
+    deltas = tickets_moving(criteria, status)
+
+    if status == "closed":
+        UserNotification.query.filter(
+            UserNotification.ticket_id.in_(matched.with_entities(SupportTicket.id))
+        ).update({"unread_admin_count": 0, "updated": now}, synchronize_session=False)
+
+    values = {
+        "status": status,
+        # Keep the one-open-ticket-per-user guard in step with the status
+        "open_user_id": SupportTicket.user_id if status == "open" else None,
+        "updated": now,
+    }
+    if status == "closed":
+        values["pending_user_messages"] = 0
+    changed = matched.update(values, synchronize_session=False)
+    bump(deltas)
+    return changed
+
+
+def delete_tickets(criteria):
+    """Delete matching tickets, their messages and notifications (no commit).
+
+    Children are removed through an id subquery, so each table sees one DELETE
+    regardless of how many tickets match. Returns tickets deleted.
+    """
+    ids = SupportTicket.query.with_entities(SupportTicket.id).filter(*criteria)
+    lock_tickets(criteria)
+    deltas = tickets_leaving(criteria)
+    AdminReadCursor.query.filter(AdminReadCursor.ticket_id.in_(ids)).delete(
+        synchronize_session=False
+    )
+    UserNotification.query.filter(UserNotification.ticket_id.in_(ids)).delete(
+        synchronize_session=False
+    )
+    SupportMessage.query.filter(SupportMessage.ticket_id.in_(ids)).delete(
+        synchronize_session=False
+    )
+    deleted = SupportTicket.query.filter(*criteria).delete(synchronize_session=False)
+    bump(deltas)
+    return deleted
+
+
+def refresh_summaries(criteria):
+    """Recompute the thread summary columns from the messages (no commit).
+
+    Message inserts maintain these incrementally; this is for backfills and
+    for jobs that delete messages out from under a ticket.
+    """
+    def scalar(column, where=()):
+        return (
+            select([column])
+            .where(SupportMessage.ticket_id == SupportTicket.id, *where)
+            .correlate(SupportTicket)  # also from the nested last-sender lookup
+            .scalar_subquery()
+        )
+
+    last_id = scalar(db.func.max(SupportMessage.id))
+    last = aliased(SupportMessage)
+    return SupportTicket.query.filter(*criteria).update({
+        "last_message_id": last_id,
+        "last_message_at": scalar(db.func.max(SupportMessage.created)),
+        "last_sender_role": (
+            select([last.sender_role]).where(last.id == last_id).scalar_subquery()
+        ),
+        "message_count": scalar(db.func.count(SupportMessage.id)),
+        "user_message_count": scalar(
+            db.func.count(SupportMessage.id), [SupportMessage.sender_role == "user"]
+        ),
+        # A recount is not activity: keep the column's onupdate from stamping now()
+        "updated": SupportTicket.updated,
+    }, synchronize_session=False)
+
+
+def broadcast_batch(user_ids, text, sender_id, now, open_missing=True):
+    """Post one admin message to each user's open ticket, opening tickets as needed (no commit).
+
+    Runs a fixed number of statements however many users are in the batch:
+    tickets, messages and notifications are each written in one go. Keep
+    batches to a few hundred users (SQLite caps bound parameters per
+    statement). With `open_missing` off, users without an open ticket are
+    skipped instead. Returns (tickets_created, messages_sent).
+    """
+    if not user_ids:
+        return 0, 0
+
+    def open_tickets(ids, lock=False):
+        query = (
+            db.session.query(SupportTicket.open_user_id, SupportTicket.id)
+            .filter(SupportTicket.open_user_id.in_(ids))
+        )
+        return dict((query.with_for_update() if lock else query).all())
+
+    tickets = open_tickets(user_ids)
+    missing = [uid for uid in user_ids if uid not in tickets]
+    created = 0
+    if missing and open_missing:
+        # Racing a player's first post is fine: the open_user_id guard ignores the dupe
+        created = db.session.execute(insert_ignore(SupportTicket, [
+            {"user_id": uid, "open_user_id": uid, "status": "open", "created": now, "updated": now}
+            for uid in missing
+        ], ["open_user_id"])).rowcount
+        # Locking read, so tickets a racing first post committed after our
+        # snapshot (MySQL REPEATABLE READ) are found rather than skipped
+        tickets.update(open_tickets(missing, lock=True))
+
+    delivered = [uid for uid in user_ids if uid in tickets]
+    if open_missing and len(delivered) < len(user_ids):
+        print(f"[BROADCAST] {len(user_ids) - len(delivered)} users skipped: ticket closed while sending")
+    if not delivered:
+        return created, 0
+
+    stored = message_fields(text)
+    db.session.execute(SupportMessage.__table__.insert(), [
+        {"ticket_id": tickets[uid], "sender_role": "admin", "sender_id": sender_id, "created": now, **stored}
+        for uid in delivered
+    ])
+
+    ticket_ids = [tickets[uid] for uid in delivered]
+    SupportTicket.query.filter(SupportTicket.id.in_(ticket_ids)).update({
+        "updated": now,
+        "last_message_id": (
+            select([db.func.max(SupportMessage.id)])
+            .where(SupportMessage.ticket_id == SupportTicket.id)
+            .scalar_subquery()
+        ),
+        "last_message_at": now,
+        "last_sender_role": "admin",
+        "message_count": SupportTicket.message_count + 1,
+    }, synchronize_session=False)
+
+    db.session.execute(upsert(UserNotification, [
+        {
+            "user_id": uid,
+            "ticket_id": tickets[uid],
+            "last_seen_message_id": 0,
+            "unread_admin_count": 1,
+            "created": now,
+            "updated": now,
+        }
+        for uid in delivered
+    ], ["user_id", "ticket_id"], {
+        "unread_admin_count": UserNotification.unread_admin_count + 1,
+        "updated": now,
+    }))
+
+    bump({"tickets_open": created})
+    record_messages("admin", len(delivered), now)
+    return created, len(delivered)
+
+
+def auto_close_stale_tickets(inactive_hours):
+    """Close open and pending tickets with no activity for `inactive_hours`"""
+    closed = 0
+    for status in ("open", "pending"):
+        closed += set_status(ticket_criteria(status=status, inactive_hours=inactive_hours), "closed")
+    db.session.commit()
+    if closed:
+        print(f"[AUTO-CLOSE] Closed {closed} tickets inactive for {inactive_hours}h")
+    return closed
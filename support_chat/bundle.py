@@ -0,0 +1,155 @@
+# bundle.py - Minified, content-hashed and precompressed widget assets
+
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+BUNDLED_ASSETS = ("support.js", "support.css", "admin.js")
+
+MIMETYPES = {
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+
+SUFFIXES = {"identity": "", "gzip": ".gz", "br": ".br"}
+
+
+def _minify_css(source):
+    if rcssmin:
+        return rcssmin.cssmin(source)
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", source).strip()
+
+
+def _minify_js(source):
+    if rjsmin:
+        return rjsmin.jsmin(source)
+    # Conservative fallback: drop indentation, blank lines and whole-line comments
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("//"):
+            continue
+        lines.append(stripped)
+    return "\n".join(lines)
+
+
+def build_bundle(src_dir, out_dir=None):
+    """Minify, fingerprint and compress the widget assets.
+
+    Returns {logical name: {"filename", "mimetype", "etag", "bodies"}} where
+    bodies maps content-encoding ("identity", "gzip", "br") to bytes. When
+    `out_dir` is given the same files (plus a manifest.json) are written
+    there so a front proxy, or load_bundle at startup, can use them.
+    """
+    bundle = {}
+    sources = hashlib.sha256()
+    for name in BUNDLED_ASSETS:
+        with open(os.path.join(src_dir, name), encoding="utf-8") as f:
+            source = f.read()
+        sources.update(source.encode("utf-8"))
+
+        base, ext = os.path.splitext(name)
+        minified = (_minify_css(source) if ext == ".css" else _minify_js(source)).encode("utf-8")
+        digest = hashlib.sha256(minified).hexdigest()[:12]
+
+        bodies = {"identity": minified, "gzip": gzip.compress(minified, compresslevel=9)}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(minified, quality=11)
+
+        bundle[name] = {
+            "filename": f"{base}.{digest}{ext}",
+            "mimetype": MIMETYPES[ext],
+            "etag": digest,
+            "bodies": bodies,
+        }
+
+    if out_dir:
+        _write_bundle(bundle, out_dir, sources.hexdigest())
+
+    return bundle
+
+
+def load_bundle(src_dir, out_dir):
+    """The bundle build_bundle wrote to `out_dir`, or None if there is none.
+
+    Only reads, so it is safe on read-only installs and with many workers
+    starting at once. A bundle built from older sources than those in
+    `src_dir` counts as none.
+    """
+    sources = hashlib.sha256()
+    try:
+        for name in BUNDLED_ASSETS:
+            with open(os.path.join(src_dir, name), encoding="utf-8") as f:
+                sources.update(f.read().encode("utf-8"))
+        with open(os.path.join(out_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("sources") != sources.hexdigest():
+            print(f"[ASSETS] {out_dir} was built from other sources; building in memory")
+            return None
+
+        bundle = {}
+        for name in BUNDLED_ASSETS:
+            entry = manifest["assets"][name]
+            bodies = {}
+            for encoding in entry["encodings"]:
+                with open(os.path.join(out_dir, entry["filename"] + SUFFIXES[encoding]), "rb") as f:
+                    bodies[encoding] = f.read()
+            bundle[name] = {
+                "filename": entry["filename"],
+                "mimetype": entry["mimetype"],
+                "etag": entry["etag"],
+                "bodies": bodies,
+            }
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"[ASSETS] Ignoring the bundle in {out_dir}: {e}")
+        return None
+    return bundle
+
+
+def _write_bundle(bundle, out_dir, sources):
+    os.makedirs(out_dir, exist_ok=True)
+    for asset in bundle.values():
+        for encoding, body in asset["bodies"].items():
+            path = os.path.join(out_dir, asset["filename"] + SUFFIXES[encoding])
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(body)
+
+    manifest = {
+        "sources": sources,
+        "assets": {
+            name: {
+                "filename": asset["filename"],
+                "mimetype": asset["mimetype"],
+                "etag": asset["etag"],
+                "encodings": sorted(asset["bodies"]),
+            }
+            for name, asset in bundle.items()
+        },
+    }
+    # Files first, manifest last and atomically: a reader never sees a half-written build
+    tmp = os.path.join(out_dir, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, "manifest.json"))
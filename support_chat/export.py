@@ -0,0 +1,152 @@
+# export.py - Streaming transcript export (NDJSON / CSV)
+
+import csv
+import io
+import json
+
+from CTFd.models import db, Users
+
+from .models import SupportTicket, SupportMessage, SupportTicketArchive, SupportMessageArchive
+from .storage import full_text
+
+EXPORT_FIELDS = [
+    "message_id",
+    "ticket_id",
+    "ticket_status",
+    "user_id",
+    "user_name",
+    "sender_role",
+    "sender_id",
+    "sender_name",
+    "created",
+    "text",
+    "archived",
+]
+
+
+def _isoformat(dt):
+    return dt.isoformat() + "Z" if dt else None
+
+
+def _live_chunks(ticket_id, since, chunk_size):
+    last_id = 0
+    while True:
+        query = (
+            db.session.query(
+                SupportMessage.id,
+                SupportMessage.ticket_id,
+                SupportMessage.sender_role,
+                SupportMessage.sender_id,
+                SupportMessage.text,
+                SupportMessage.body,
+                SupportMessage.created,
+                SupportTicket.user_id,
+                SupportTicket.status,
+                db.literal(None).label("archived"),
+            )
+            .join(SupportTicket, SupportTicket.id == SupportMessage.ticket_id)
+            .filter(SupportMessage.id > last_id)
+        )
+        if ticket_id:
+            query = query.filter(SupportMessage.ticket_id == ticket_id)
+        if since:
+            query = query.filter(SupportMessage.created >= since)
+
+        rows = query.order_by(SupportMessage.id.asc()).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _archived_chunks(ticket_id, since, chunk_size):
+    # The same id can be archived more than once, so the keyset is (archived, id)
+    last = None
+    while True:
+        query = (
+            db.session.query(
+                SupportMessageArchive.id,
+                SupportMessageArchive.ticket_id,
+                SupportMessageArchive.sender_role,
+                SupportMessageArchive.sender_id,
+                SupportMessageArchive.text,
+                SupportMessageArchive.body,
+                SupportMessageArchive.created,
+                SupportTicketArchive.user_id,
+                SupportTicketArchive.status,
+                SupportMessageArchive.archived,
+            )
+            .join(SupportTicketArchive, db.and_(
+                SupportTicketArchive.id == SupportMessageArchive.ticket_id,
+                SupportTicketArchive.archived == SupportMessageArchive.archived,
+            ))
+        )
+        if last:
+            query = query.filter(db.or_(
+                SupportMessageArchive.archived > last.archived,
+                db.and_(SupportMessageArchive.archived == last.archived, SupportMessageArchive.id > last.id),
+            ))
+        if ticket_id:
+            query = query.filter(SupportMessageArchive.ticket_id == ticket_id)
+        if since:
+            query = query.filter(SupportMessageArchive.created >= since)
+
+        rows = (query.order_by(SupportMessageArchive.archived.asc(), SupportMessageArchive.id.asc())
+                .limit(chunk_size).all())
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+
+
+def iter_message_rows(ticket_id=None, since=None, include_archive=False, chunk_size=1000):
+    """Yield export rows in message id order, one keyset chunk at a time.
+
+    Only `chunk_size` rows and their user names are held in memory at once, so
+    exports of any size run in flat memory. With `include_archive`, threads
+    moved out by the retention job follow the live ones, each row stamped with
+    when it was archived.
+    """
+    sources = [_live_chunks(ticket_id, since, chunk_size)]
+    if include_archive:
+        sources.append(_archived_chunks(ticket_id, since, chunk_size))
+
+    for chunks in sources:
+        for rows in chunks:
+            user_ids = {r.user_id for r in rows} | {r.sender_id for r in rows}
+            names = dict(
+                Users.query.with_entities(Users.id, Users.name).filter(Users.id.in_(user_ids)).all()
+            )
+
+            for r in rows:
+                yield {
+                    "message_id": r.id,
+                    "ticket_id": r.ticket_id,
+                    "ticket_status": r.status,
+                    "user_id": r.user_id,
+                    "user_name": names.get(r.user_id),
+                    "sender_role": r.sender_role,
+                    "sender_id": r.sender_id,
+                    "sender_name": names.get(r.sender_id),
+                    "created": _isoformat(r.created),
+                    "text": full_text(r.text, r.body),
+                    "archived": _isoformat(r.archived),
+                }
+
+
+def ndjson_stream(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def csv_stream(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
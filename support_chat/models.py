@@ -1,31 +1,52 @@
-# models.py - Updated with timezone-aware to_dict() method
+# models.py - Compact wire format: epoch-millisecond timestamps, display timezone is applied client-side
 
-from datetime import datetime, timezone, timedelta
+import calendar
+from datetime import datetime
 from CTFd.models import db
 
-# UTC+8 timezone for display
-DISPLAY_TIMEZONE = timezone(timedelta(hours=8))
-
-def format_datetime_for_display(dt):
-    """Convert UTC datetime to UTC+8 for display"""
+def to_epoch_ms(dt):
+    """Naive UTC datetime -> integer epoch milliseconds (what the JS widgets expect)"""
     if not dt:
         return None
-    
-    # If dt is naive, assume it's UTC
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    
-    # Convert to UTC+8
-    local_dt = dt.astimezone(DISPLAY_TIMEZONE)
-    return local_dt
+    return calendar.timegm(dt.utctimetuple()) * 1000 + dt.microsecond // 1000
+
+def pack_rows(items):
+    """Column-array encoding for lists of dicts: {"fields": [...], "rows": [[...], ...]}.
+
+    Repeated keys dominate the size of long message lists; the JS side unpacks
+    this back into objects with unpackRows().
+    """
+    fields = []
+    seen = set()
+    for item in items:
+        for key in item:
+            if key not in seen:
+                seen.add(key)
+                fields.append(key)
+    return {"fields": fields, "rows": [[item.get(f) for f in fields] for item in items]}
 
 class SupportTicket(db.Model):
     __tablename__ = "support_tickets"
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False, index=True)
     status = db.Column(db.String(16), default="open", nullable=False)
+    # Equals user_id while the ticket is open, NULL otherwise; the unique index on it
+    # guarantees at most one open ticket per user even under concurrent posts.
+    # Every status change goes through bulk.set_status, which keeps it in step.
+    open_user_id = db.Column(db.Integer, nullable=True, unique=True)
     created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+    # Maintained on every write for the stats endpoint
+    pending_user_messages = db.Column(db.Integer, default=0, nullable=False)  # user messages since last admin reply
+    first_user_message_at = db.Column(db.DateTime, nullable=True)
+    first_response_at = db.Column(db.DateTime, nullable=True, index=True)
+    first_responder_id = db.Column(db.Integer, nullable=True)
+    # Thread summary, kept in step with every message insert (see message_summary)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True, index=True)
+    last_sender_role = db.Column(db.String(16), nullable=True)
+    message_count = db.Column(db.Integer, default=0, nullable=False)
+    user_message_count = db.Column(db.Integer, default=0, nullable=False)
 
 class SupportMessage(db.Model):
     __tablename__ = "support_messages"
@@ -33,28 +54,36 @@ class SupportMessage(db.Model):
     ticket_id = db.Column(db.Integer, db.ForeignKey("support_tickets.id"), index=True, nullable=False)
     sender_role = db.Column(db.String(16), nullable=False)  # "user" | "admin"
     sender_id = db.Column(db.Integer, nullable=False)
-    text = db.Column(db.Text, nullable=False)
+    text = db.Column(db.Text, nullable=False)  # whole message, or a preview when `body` is set
     created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Long messages: zlib-compressed full text, loaded only when asked for (see storage.py)
+    body = db.deferred(db.Column(db.LargeBinary(length=2 ** 24), nullable=True))
+    full_length = db.Column(db.Integer, nullable=True)
 
     def to_dict(self):
-        # Convert timestamp to UTC+8 for consistent display
-        display_time = format_datetime_for_display(self.created)
-        
-        return {
+        d = {
             "id": self.id,
             "ticket_id": self.ticket_id,
             "sender_role": self.sender_role,
             "sender_id": self.sender_id,
             "text": self.text,
-            # Send timezone-adjusted timestamp (no Z suffix since it's already converted)
-            "created": display_time.isoformat() if display_time else None,
+            # Epoch milliseconds (UTC); the client formats it in the display timezone
+            "created": to_epoch_ms(self.created),
         }
+        if self.full_length:
+            # `text` is a preview; the client fetches the rest on demand
+            d["truncated"] = True
+            d["full_length"] = self.full_length
+        return d
 
 class UserNotification(db.Model):
     __tablename__ = "user_notifications"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "ticket_id", name="uq_user_notifications_user_ticket"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)  # no FK: users may be in another database
     ticket_id = db.Column(db.Integer, db.ForeignKey("support_tickets.id", ondelete="CASCADE"), nullable=False, index=True)
     last_seen_message_id = db.Column(db.Integer, default=0, nullable=False)
     unread_admin_count = db.Column(db.Integer, default=0, nullable=False)
@@ -62,4 +91,74 @@ class UserNotification(db.Model):
     updated = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
     
     def __repr__(self):
-        return f"<UserNotification user_id={self.user_id} ticket_id={self.ticket_id} unread={self.unread_admin_count}>"
\ No newline at end of file
+        return f"<UserNotification user_id={self.user_id} ticket_id={self.ticket_id} unread={self.unread_admin_count}>"
+
+def message_summary(message):
+    """Ticket column updates for a newly flushed message (SQL expressions, safe under concurrency)"""
+    values = {
+        "last_message_id": message.id,
+        "last_message_at": message.created,
+        "last_sender_role": message.sender_role,
+        "message_count": SupportTicket.message_count + 1,
+    }
+    if message.sender_role == "user":
+        values["user_message_count"] = SupportTicket.user_message_count + 1
+    return values
+
+class AdminReadCursor(db.Model):
+    """How far each admin has read each thread.
+
+    read_user_messages snapshots the ticket's user_message_count when the admin
+    last opened it, so the inbox badge is a subtraction, not a COUNT.
+    """
+    __tablename__ = "support_admin_reads"
+    __table_args__ = (
+        db.UniqueConstraint("admin_id", "ticket_id", name="uq_support_admin_reads_admin_ticket"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    admin_id = db.Column(db.Integer, nullable=False)
+    ticket_id = db.Column(db.Integer, db.ForeignKey("support_tickets.id", ondelete="CASCADE"), nullable=False, index=True)
+    last_read_message_id = db.Column(db.Integer, default=0, nullable=False)
+    read_user_messages = db.Column(db.Integer, default=0, nullable=False)
+    updated = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class SupportCounter(db.Model):
+    """Named running totals (tickets per status, unread-by-admin), bumped on each write"""
+    __tablename__ = "support_counters"
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+
+class SupportHourlyStat(db.Model):
+    __tablename__ = "support_hourly_stats"
+    hour = db.Column(db.DateTime, primary_key=True)  # UTC, truncated to the hour
+    user_messages = db.Column(db.Integer, default=0, nullable=False)
+    admin_messages = db.Column(db.Integer, default=0, nullable=False)
+
+class SupportTicketArchive(db.Model):
+    """Closed tickets moved out of the hot table by the retention job.
+
+    Keyed by (original id, archived) because SQLite and older MySQL can hand a
+    deleted id out again, so the same id may be archived more than once.
+    """
+    __tablename__ = "support_tickets_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False)
+
+class SupportMessageArchive(db.Model):
+    __tablename__ = "support_messages_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived = db.Column(db.DateTime, primary_key=True)
+    ticket_id = db.Column(db.Integer, index=True, nullable=False)
+    sender_role = db.Column(db.String(16), nullable=False)
+    sender_id = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    body = db.deferred(db.Column(db.LargeBinary(length=2 ** 24), nullable=True))
+    full_length = db.Column(db.Integer, nullable=True)
+
+    to_dict = SupportMessage.to_dict
@@ -0,0 +1,143 @@
+# querybudget.py - Statement counting against fixed per-route budgets
+
+import math
+import threading
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statements a request may run, whatever the number of tickets, messages or
+# users. Includes CTFd's own session/user lookups; a per-row query anywhere in
+# these handlers breaks the budget as soon as the data grows. Each is the most
+# the route ran with tests/ seeded at 10, 1,000 and 10,000 rows and CTFd's
+# caches cleared, plus 2 for CTFd versions that look up a little more.
+ROUTE_BUDGETS = {
+    "support_chat.get_or_create_ticket": 7,     # measured 5
+    "support_chat.post_user_message": 12,       # measured 10
+    "support_chat.get_full_message": 4,         # measured 2
+    "support_chat.mark_messages_read": 7,       # measured 5
+    "support_chat.get_unread_count": 6,         # measured 4
+    "support_chat.support_admin_home": 6,       # measured 4
+    "support_chat.support_admin_ticket": 7,     # measured 5
+    "support_chat.support_admin_reply": 12,     # measured 10
+    "support_chat.support_admin_stats": 7,      # measured 5
+    "support_chat.support_admin_search": 6,     # measured 4
+}
+
+# Broadcasts run in batches; each batch gets this budget regardless of its size.
+# Measured exactly: a batch that has to open tickets runs 8, one that does not 5
+BROADCAST_BATCH_BUDGET = 8
+# ...and the whole request a fixed allowance (CTFd's lookups, the team) on top of
+# one keyset page query plus one batch budget per batch; measured 5, plus 3
+BROADCAST_REQUEST_BUDGET = 8
+
+
+def broadcast_budget(recipients, batch_size):
+    """Statements a broadcast to `recipients` users may run in total"""
+    batches = math.ceil(recipients / batch_size)
+    return BROADCAST_REQUEST_BUDGET + batches * (BROADCAST_BATCH_BUDGET + 1)
+
+MODES = ("off", "warn", "strict")
+
+_mode = "off"
+_local = threading.local()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class _Counter:
+    def __init__(self, label, budget):
+        self.label = label
+        self.budget = budget
+        self.count = 0
+        self.statements = []
+
+
+def _on_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, "counters", ()):
+        counter.count += 1
+        if len(counter.statements) <= counter.budget + 5:
+            counter.statements.append(" ".join(statement.split())[:200])
+
+
+def _start(label, budget):
+    counter = _Counter(label, budget)
+    _local.__dict__.setdefault("counters", []).append(counter)
+    return counter
+
+
+def _finish(counter):
+    counters = getattr(_local, "counters", [])
+    if counter in counters:
+        counters.remove(counter)
+    if counter.count <= counter.budget:
+        return
+    message = f"{counter.label} ran {counter.count} statements (budget {counter.budget})"
+    if _mode == "strict":
+        raise QueryBudgetExceeded(message + ":\n  " + "\n  ".join(counter.statements))
+    print(f"[QUERY BUDGET] {message}; first statements: {counter.statements[:counter.budget + 1]}")
+
+
+@contextmanager
+def query_budget(label, budget):
+    """Count the SQL statements run inside the block and report if there are more than `budget`"""
+    if _mode == "off":
+        yield None
+        return
+    counter = _start(label, budget)
+    try:
+        yield counter
+    except BaseException:
+        _local.counters.remove(counter)
+        raise
+    _finish(counter)
+
+
+def init_query_budget(app, blueprint):
+    """Enable per-route budgets when SUPPORT_CHAT_QUERY_BUDGET is "warn" or "strict".
+
+    "warn" logs offending requests; "strict" raises QueryBudgetExceeded, which
+    is what a test run or staging load test wants. Every counted response
+    carries X-Support-Chat-Queries. The hooks go on the app, not the shared
+    module-level blueprint, so loading the plugin into a second app (tests,
+    app factories) does not stack another set on the first; calling this
+    twice for the same app is a no-op.
+    """
+    global _mode
+    mode = str(app.config.get("SUPPORT_CHAT_QUERY_BUDGET") or "off").lower()
+    _mode = mode if mode in MODES else "off"
+    if _mode == "off" or "support_chat_query_budget" in app.extensions:
+        return
+    app.extensions["support_chat_query_budget"] = _mode
+
+    if not event.contains(Engine, "before_cursor_execute", _on_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _on_cursor_execute)
+
+    @app.before_request
+    def _count_queries():
+        if request.blueprint != blueprint.name:
+            return
+        budget = ROUTE_BUDGETS.get(request.endpoint)
+        if budget is not None:
+            g.support_chat_queries = _start(request.endpoint, budget)
+
+    @app.after_request
+    def _check_queries(response):
+        counter = g.pop("support_chat_queries", None)
+        if counter is not None:
+            response.headers["X-Support-Chat-Queries"] = str(counter.count)
+            _finish(counter)
+        return response
+
+    @app.teardown_request
+    def _drop_counter(exc):
+        # after_request does not run when the view raised
+        counter = g.pop("support_chat_queries", None)
+        if counter is not None and counter in getattr(_local, "counters", ()):
+            _local.counters.remove(counter)
+
+    print(f"[QUERY BUDGET] Enabled ({_mode})")
@@ -0,0 +1,109 @@
+# ratelimit.py - Per-user token buckets shared across workers
+
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Atomic refill-and-take; returns {allowed, retry_after_ms}
+_REDIS_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, retry}
+"""
+
+
+class RedisBuckets:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        allowed, retry_ms = self.script(keys=[key], args=[capacity, rate, time.time()])
+        return bool(allowed), int(retry_ms) / 1000.0
+
+
+class SQLiteBuckets:
+    """Stand-in for Redis on single-host deployments: a small SQLite file that
+    every worker process opens, serialized with BEGIN IMMEDIATE."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, ts FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, ts) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        retry_after = 0.0 if allowed else math.ceil((1 - tokens) / rate * 1000) / 1000.0
+        return allowed, retry_after
+
+
+class RateLimiter:
+    """Token bucket per (scope, user). Fails open if the backing store errors."""
+
+    def __init__(self, redis_url=None, sqlite_path=None):
+        self.backend = None
+        try:
+            if redis_url:
+                self.backend = RedisBuckets(redis_url)
+            else:
+                path = sqlite_path or os.path.join(tempfile.gettempdir(), "support_chat_ratelimit.sqlite3")
+                self.backend = SQLiteBuckets(path)
+        except Exception as e:
+            print(f"[RATELIMIT] Disabled, could not open backend: {e}")
+
+    def hit(self, scope, user_id, capacity, per_minute):
+        """Take one token. Returns (allowed, retry_after_seconds)."""
+        if self.backend is None or capacity <= 0 or per_minute <= 0:
+            return True, 0.0
+        try:
+            return self.backend.take(f"support_chat:rl:{scope}:{user_id}", capacity, per_minute / 60.0)
+        except Exception as e:
+            print(f"[RATELIMIT] Backend error, allowing request: {e}")
+            return True, 0.0
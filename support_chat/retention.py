@@ -0,0 +1,161 @@
+# retention.py - Archival of closed tickets, early for those holding only broadcasts
+
+import time
+from datetime import datetime, timedelta
+
+from CTFd.models import db
+
+from .bulk import delete_tickets, lock_tickets
+from .models import (
+    SupportTicket,
+    SupportMessage,
+    SupportTicketArchive,
+    SupportMessageArchive,
+)
+
+BROADCAST_PREFIX = "[BROADCAST"
+
+
+def _archive_batch(criteria, batch_size):
+    """Copy up to `batch_size` matching tickets and their messages into the archive
+    tables and remove them from the live ones (no commit).
+
+    The tickets are locked and re-checked against `criteria` first, so a ticket
+    reopened or replied to since it was picked is left alone. Returns
+    (picked, archived); an empty `picked` means nothing matched.
+    """
+    picked = [
+        row.id
+        for row in SupportTicket.query.with_entities(SupportTicket.id)
+        .filter(*criteria)
+        .order_by(SupportTicket.id.asc())
+        .limit(batch_size)
+        .all()
+    ]
+    if not picked:
+        return picked, []
+    ids = lock_tickets([SupportTicket.id.in_(picked), *criteria])
+    if not ids:
+        return picked, ids
+
+    now = datetime.utcnow().replace(microsecond=0)
+    db.session.execute(
+        SupportTicketArchive.__table__.insert().from_select(
+            ["id", "archived", "user_id", "status", "created", "updated"],
+            SupportTicket.query.with_entities(
+                SupportTicket.id,
+                db.literal(now),
+                SupportTicket.user_id,
+                SupportTicket.status,
+                SupportTicket.created,
+                SupportTicket.updated,
+            ).filter(SupportTicket.id.in_(ids)).statement,
+        )
+    )
+    db.session.execute(
+        SupportMessageArchive.__table__.insert().from_select(
+            ["id", "archived", "ticket_id", "sender_role", "sender_id", "text", "created",
+             "body", "full_length"],
+            SupportMessage.query.with_entities(
+                SupportMessage.id,
+                db.literal(now),
+                SupportMessage.ticket_id,
+                SupportMessage.sender_role,
+                SupportMessage.sender_id,
+                SupportMessage.text,
+                SupportMessage.created,
+                SupportMessage.body,
+                SupportMessage.full_length,
+            ).filter(SupportMessage.ticket_id.in_(ids)).statement,
+        )
+    )
+    delete_tickets([SupportTicket.id.in_(ids)])
+    return picked, ids
+
+
+def _archive_where(criteria, label, batch_size, pause):
+    """Archive every ticket matching `criteria`, one committed batch at a time"""
+    archived = 0
+    while True:
+        try:
+            picked, ids = _archive_batch(criteria, batch_size)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if not picked:
+            break
+
+        archived += len(ids)
+        print(f"[RETENTION] Archived {len(ids)} {label} (total {archived})")
+        if pause:
+            time.sleep(pause)
+
+    return archived
+
+
+def archive_closed_tickets(older_than_days=30, batch_size=200, pause=0.05):
+    """Move closed tickets untouched for `older_than_days` into the archive tables.
+
+    Each batch is copied with INSERT ... SELECT, removed from the live tables and
+    committed on its own, so live tables are only locked for one short batch.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    return _archive_where(
+        [SupportTicket.status == "closed", SupportTicket.updated < cutoff],
+        "tickets", batch_size, pause,
+    )
+
+
+def compact_broadcasts(older_than_days=7, batch_size=200, pause=0.05):
+    """Archive closed tickets that hold nothing but broadcasts older than `older_than_days`.
+
+    Broadcasts are fanned out as one message per user, so after an event they
+    make up most of the live message table, mostly in tickets the player never
+    wrote in. Those leave the live tables early, whole and readable from the
+    archive like any other; open tickets and threads with real conversation
+    wait for archive_closed_tickets. Returns tickets archived.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    conversation = SupportMessage.query.filter(
+        SupportMessage.ticket_id == SupportTicket.id,
+        db.or_(
+            SupportMessage.sender_role != "admin",
+            db.not_(SupportMessage.text.like(BROADCAST_PREFIX + "%")),
+        ),
+    )
+    return _archive_where(
+        [
+            SupportTicket.status == "closed",
+            SupportTicket.updated < cutoff,
+            ~conversation.exists().correlate(SupportTicket),
+        ],
+        "broadcast-only tickets", batch_size, pause,
+    )
+
+
+def get_archived_ticket(ticket_id):
+    """Most recent archived copy of a ticket and its messages, or (None, [])"""
+    t = (
+        SupportTicketArchive.query.filter_by(id=ticket_id)
+        .order_by(SupportTicketArchive.archived.desc())
+        .first()
+    )
+    if not t:
+        return None, []
+    msgs = (
+        SupportMessageArchive.query.filter_by(ticket_id=t.id, archived=t.archived)
+        .order_by(SupportMessageArchive.created.asc())
+        .all()
+    )
+    return t, msgs
+
+
+def run_retention(archive_after_days=30, broadcast_after_days=7, batch_size=200):
+    archived = archive_closed_tickets(archive_after_days, batch_size)
+    broadcast_only = compact_broadcasts(broadcast_after_days, batch_size)
+    return {
+        "archived_tickets": archived,
+        "archived_broadcast_tickets": broadcast_only,
+    }
+
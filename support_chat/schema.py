@@ -0,0 +1,117 @@
+# schema.py - In-place upgrades for installs whose tables predate newer columns
+
+import sqlalchemy as sa
+
+from CTFd.models import db
+
+from .models import SupportTicket, SupportMessage, SupportMessageArchive, UserNotification
+from .bulk import refresh_summaries
+from .binds import chat_connection
+
+
+def ensure_schema():
+    """Bring existing tables up to the current models.
+
+    db.create_all() only creates missing tables, so columns and constraints
+    added after a table was first created are applied here, once, at load.
+    """
+    try:
+        inspector = sa.inspect(chat_connection())
+        _ensure_open_ticket_guard(inspector)
+        _ensure_notification_unique(inspector)
+        _add_columns(inspector, SupportTicket, [
+            "pending_user_messages", "first_user_message_at", "first_response_at", "first_responder_id",
+        ])
+        if _add_columns(inspector, SupportTicket, [
+            "last_message_id", "last_message_at", "last_sender_role", "message_count", "user_message_count",
+        ]):
+            refresh_summaries([])
+            print("[SCHEMA] Backfilled ticket summaries")
+        _add_columns(inspector, SupportMessage, ["body", "full_length"])
+        _add_columns(inspector, SupportMessageArchive, ["body", "full_length"])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[SCHEMA] Upgrade failed: {e}")
+
+
+def _has_column(inspector, table, column):
+    return any(c["name"] == column for c in inspector.get_columns(table))
+
+
+def _has_unique(inspector, table, columns):
+    wanted = set(columns)
+    for uc in inspector.get_unique_constraints(table):
+        if set(uc["column_names"]) == wanted:
+            return True
+    for ix in inspector.get_indexes(table):
+        if ix.get("unique") and set(ix["column_names"]) == wanted:
+            return True
+    return False
+
+
+def _add_columns(inspector, model, names):
+    """ADD COLUMN for each model column missing from the table, plus its index.
+
+    Returns the names that were added.
+    """
+    table = model.__tablename__
+    conn = chat_connection()
+    added = []
+    for name in names:
+        if _has_column(inspector, table, name):
+            continue
+        column = model.__table__.c[name]
+        ddl = f"ALTER TABLE {table} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+        if column.default is not None and column.default.is_scalar:
+            ddl += f" NOT NULL DEFAULT {column.default.arg}"
+        conn.execute(sa.text(ddl))
+        if column.index:
+            conn.execute(sa.text(f"CREATE INDEX ix_{table}_{name} ON {table} ({name})"))
+        print(f"[SCHEMA] Added {table}.{name}")
+        added.append(name)
+    return added
+
+
+def _ensure_open_ticket_guard(inspector):
+    """Add open_user_id and its unique index, each only if missing.
+
+    An upgrade that stopped between the two steps leaves the column without
+    the index; the guard is then re-derived from status before indexing.
+    """
+    table = SupportTicket.__tablename__
+    has_column = _has_column(inspector, table, "open_user_id")
+    if has_column and _has_unique(inspector, table, ["open_user_id"]):
+        return
+    conn = chat_connection()
+
+    if not has_column:
+        conn.execute(sa.text(f"ALTER TABLE {table} ADD COLUMN open_user_id INTEGER NULL"))
+    # Older versions could leave several open tickets per user; the newest one
+    # (the one the widget shows) takes the guard, the rest stay visible to admins
+    latest = f"SELECT id FROM (SELECT MAX(id) AS id FROM {table} WHERE status = 'open' GROUP BY user_id) AS latest"
+    conn.execute(sa.text(
+        f"UPDATE {table} SET open_user_id = NULL WHERE open_user_id IS NOT NULL AND id NOT IN ({latest})"
+    ))
+    conn.execute(sa.text(f"UPDATE {table} SET open_user_id = user_id WHERE id IN ({latest})"))
+    conn.execute(sa.text(
+        f"CREATE UNIQUE INDEX uq_{table}_open_user_id ON {table} (open_user_id)"
+    ))
+    print("[SCHEMA] Added one-open-ticket-per-user guard to support_tickets")
+
+
+def _ensure_notification_unique(inspector):
+    table = UserNotification.__tablename__
+    if _has_unique(inspector, table, ["user_id", "ticket_id"]):
+        return
+    conn = chat_connection()
+
+    # Keep the newest row for any duplicated (user, ticket) pair
+    conn.execute(sa.text(
+        f"DELETE FROM {table} WHERE id NOT IN ("
+        f"SELECT id FROM (SELECT MAX(id) AS id FROM {table} GROUP BY user_id, ticket_id) AS keep)"
+    ))
+    conn.execute(sa.text(
+        f"CREATE UNIQUE INDEX uq_user_notifications_user_ticket ON {table} (user_id, ticket_id)"
+    ))
+    print("[SCHEMA] Added unique (user_id, ticket_id) to user_notifications")
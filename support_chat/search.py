@@ -0,0 +1,150 @@
+# search.py - Full-text search over support messages for admins
+
+import re
+
+from CTFd.models import db, Users
+
+from .models import SupportTicket, SupportMessage
+from .binds import chat_connection, chat_dialect
+
+FTS_TABLE = "support_messages_fts"
+MYSQL_INDEX = "ix_support_messages_text_ft"
+PG_INDEX = "ix_support_messages_text_tsv"
+
+# Split on whitespace and drop characters with meaning in FTS5 / MySQL boolean syntax
+_TERM_RE = re.compile(r"[^\s\"'()*+\-:^~<>@]+")
+
+# Set once the dialect's index exists; until then searches fall back to LIKE
+_index_ready = False
+
+
+def ensure_search_index():
+    """Create the dialect's full-text index once; the database keeps it current.
+
+    SQLite gets an external-content FTS5 table fed by triggers, MySQL a FULLTEXT
+    index and PostgreSQL a GIN expression index. Other backends fall back to LIKE.
+    """
+    global _index_ready
+    dialect = chat_dialect()
+    try:
+        if dialect == "sqlite":
+            _ensure_sqlite_fts()
+        elif dialect == "mysql":
+            _ensure_mysql_fulltext()
+        elif dialect == "postgresql":
+            chat_connection().execute(db.text(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON support_messages "
+                "USING gin (to_tsvector('simple', text))"
+            ))
+        db.session.commit()
+        _index_ready = dialect in ("sqlite", "mysql", "postgresql")
+    except Exception as e:
+        db.session.rollback()
+        print(f"[SEARCH] Could not create full-text index ({dialect}), using LIKE: {e}")
+
+
+def _ensure_sqlite_fts():
+    conn = chat_connection()
+    exists = conn.execute(
+        db.text("SELECT name FROM sqlite_master WHERE type='table' AND name=:n"),
+        {"n": FTS_TABLE},
+    ).first()
+    if exists:
+        return
+
+    conn.execute(db.text(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        "text, content='support_messages', content_rowid='id')"
+    ))
+    conn.execute(db.text(
+        f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON support_messages BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+    ))
+    conn.execute(db.text(
+        f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON support_messages BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); END"
+    ))
+    conn.execute(db.text(
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF text ON support_messages BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); "
+        f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+    ))
+    # Index the messages that existed before the plugin was upgraded
+    conn.execute(db.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    print("[SEARCH] Created SQLite FTS5 index for support messages")
+
+
+def _ensure_mysql_fulltext():
+    conn = chat_connection()
+    exists = conn.execute(
+        db.text(
+            "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+            "AND table_name = 'support_messages' AND index_name = :n LIMIT 1"
+        ),
+        {"n": MYSQL_INDEX},
+    ).first()
+    if not exists:
+        conn.execute(db.text(
+            f"ALTER TABLE support_messages ADD FULLTEXT INDEX {MYSQL_INDEX} (text)"
+        ))
+        print("[SEARCH] Created MySQL FULLTEXT index for support messages")
+
+
+def _match_clause(terms):
+    """Dialect-specific WHERE clause matching all terms"""
+    dialect = chat_dialect()
+
+    if _index_ready and dialect == "sqlite":
+        query = " ".join('"{}"'.format(t.replace('"', '""')) for t in terms)
+        return db.text(
+            f"support_messages.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_q)"
+        ), {"fts_q": query}
+
+    if _index_ready and dialect == "mysql":
+        query = " ".join(f"+{t}*" for t in terms)
+        return db.text("MATCH (support_messages.text) AGAINST (:fts_q IN BOOLEAN MODE)"), {"fts_q": query}
+
+    if _index_ready and dialect == "postgresql":
+        return db.text(
+            "to_tsvector('simple', support_messages.text) @@ plainto_tsquery('simple', :fts_q)"
+        ), {"fts_q": " ".join(terms)}
+
+    return db.and_(*[SupportMessage.text.contains(t, autoescape=True) for t in terms]), {}
+
+
+def search_messages(q, team_id=None, sender_role=None, date_from=None, date_to=None,
+                    page=1, per_page=25):
+    """Return (messages, has_more) for a full-text query, newest first.
+
+    Filters are combined with the index match so only one statement runs per page.
+    """
+    terms = _TERM_RE.findall(q or "")
+    if not terms:
+        return [], False
+
+    clause, params = _match_clause(terms)
+    query = SupportMessage.query.filter(clause)
+
+    if sender_role in ("user", "admin"):
+        query = query.filter(SupportMessage.sender_role == sender_role)
+    if date_from:
+        query = query.filter(SupportMessage.created >= date_from)
+    if date_to:
+        query = query.filter(SupportMessage.created < date_to)
+    if team_id:
+        # Resolved up front: users may live in another database than the messages
+        team_users = [
+            row.id for row in Users.query.with_entities(Users.id).filter(Users.team_id == team_id)
+        ]
+        query = query.join(SupportTicket, SupportTicket.id == SupportMessage.ticket_id).filter(
+            SupportTicket.user_id.in_(team_users)
+        )
+
+    rows = (
+        query.params(**params)
+        .order_by(SupportMessage.id.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+        .all()
+    )
+    return rows[:per_page], len(rows) > per_page
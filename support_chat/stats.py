@@ -0,0 +1,169 @@
+# stats.py - Incrementally maintained support statistics
+
+from datetime import datetime, timedelta
+
+from CTFd.models import db, Users
+
+from .models import SupportTicket, SupportCounter, SupportHourlyStat, to_epoch_ms
+from .upsert import upsert
+
+STATUS_COUNTERS = {
+    "open": "tickets_open",
+    "closed": "tickets_closed",
+    "pending": "tickets_pending",
+}
+UNREAD_BY_ADMIN = "unread_by_admin"
+
+
+def _counter(status):
+    return STATUS_COUNTERS.get(status, f"tickets_{status}")
+
+
+def bump(deltas):
+    """Add deltas to named counters - one upsert per non-zero counter (no commit).
+
+    Counter and hourly rows are hot, so every write path bumps them last, after
+    its ticket rows are locked, and in name order; the locks are then always
+    taken in the same order and two writers cannot deadlock on them.
+    """
+    for name, delta in sorted(deltas.items()):
+        if delta:
+            db.session.execute(upsert(
+                SupportCounter,
+                {"name": name, "value": delta},
+                ["name"],
+                {"value": SupportCounter.value + delta},
+            ))
+
+
+def record_messages(role, count=1, when=None):
+    """Count messages into their hourly bucket (no commit)"""
+    if not count:
+        return
+    hour = (when or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    column = "admin_messages" if role == "admin" else "user_messages"
+    values = {"hour": hour, "user_messages": 0, "admin_messages": 0}
+    values[column] = count
+    db.session.execute(upsert(
+        SupportHourlyStat, values, ["hour"],
+        {column: getattr(SupportHourlyStat, column) + count},
+    ))
+
+
+def _totals_by_status(criteria):
+    return (
+        db.session.query(
+            SupportTicket.status,
+            db.func.count(SupportTicket.id),
+            db.func.coalesce(db.func.sum(SupportTicket.pending_user_messages), 0),
+        )
+        .filter(*criteria)
+        .group_by(SupportTicket.status)
+        .all()
+    )
+
+
+def tickets_moving(criteria, new_status):
+    """Counter deltas for tickets about to change to `new_status`.
+
+    Call with the tickets locked, before the UPDATE; bump() them after it.
+    """
+    deltas = {}
+    for status, count, pending in _totals_by_status(criteria):
+        if status == new_status:
+            continue
+        deltas[_counter(status)] = deltas.get(_counter(status), 0) - count
+        deltas[_counter(new_status)] = deltas.get(_counter(new_status), 0) + count
+        if new_status == "closed":
+            # Closing clears what admins still owed the player
+            deltas[UNREAD_BY_ADMIN] = deltas.get(UNREAD_BY_ADMIN, 0) - int(pending)
+    return deltas
+
+
+def tickets_leaving(criteria):
+    """Counter deltas for tickets about to be deleted or archived.
+
+    Call with the tickets locked, before the DELETE; bump() them after it.
+    """
+    deltas = {}
+    for status, count, pending in _totals_by_status(criteria):
+        deltas[_counter(status)] = -count
+        deltas[UNREAD_BY_ADMIN] = deltas.get(UNREAD_BY_ADMIN, 0) - int(pending)
+    return deltas
+
+
+def rebuild_counters():
+    """Recompute the running totals from the tables (first load, or to repair drift)"""
+    SupportCounter.query.delete(synchronize_session=False)
+    values = {name: 0 for name in STATUS_COUNTERS.values()}
+    values[UNREAD_BY_ADMIN] = 0
+    for status, count, pending in _totals_by_status([]):
+        values[_counter(status)] = count
+        values[UNREAD_BY_ADMIN] += int(pending)
+    db.session.add_all([SupportCounter(name=k, value=v) for k, v in values.items()])
+    db.session.commit()
+    return values
+
+
+def ensure_counters():
+    if not db.session.query(SupportCounter.name).first():
+        print(f"[STATS] Initialised counters: {rebuild_counters()}")
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def snapshot(hours=24, response_days=7):
+    """Everything the dashboards show, read from counters and small recent windows"""
+    counters = dict(db.session.query(SupportCounter.name, SupportCounter.value).all())
+    now = datetime.utcnow()
+
+    since_hour = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    hourly = (
+        SupportHourlyStat.query.filter(SupportHourlyStat.hour >= since_hour)
+        .order_by(SupportHourlyStat.hour.asc())
+        .all()
+    )
+
+    # First responses in the window only - an indexed range, not a table scan
+    responses = (
+        db.session.query(
+            SupportTicket.first_responder_id,
+            SupportTicket.first_user_message_at,
+            SupportTicket.first_response_at,
+        )
+        .filter(SupportTicket.first_response_at >= now - timedelta(days=response_days))
+        .all()
+    )
+    per_admin = {}
+    for admin_id, asked, answered in responses:
+        if admin_id and asked and answered:
+            per_admin.setdefault(admin_id, []).append((answered - asked).total_seconds())
+
+    names = {}
+    if per_admin:
+        names = dict(
+            Users.query.with_entities(Users.id, Users.name).filter(Users.id.in_(per_admin)).all()
+        )
+
+    return {
+        "tickets": {status: int(counters.get(name, 0)) for status, name in STATUS_COUNTERS.items()},
+        "unread_by_admin": int(counters.get(UNREAD_BY_ADMIN, 0)),
+        "messages_per_hour": [
+            {"hour": to_epoch_ms(h.hour), "user": h.user_messages, "admin": h.admin_messages} for h in hourly
+        ],
+        "first_response": [
+            {
+                "admin_id": admin_id,
+                "name": names.get(admin_id),
+                "tickets": len(seconds),
+                "median_seconds": round(_median(seconds)),
+            }
+            for admin_id, seconds in sorted(per_admin.items(), key=lambda kv: _median(kv[1]))
+        ],
+    }
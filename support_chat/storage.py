@@ -0,0 +1,46 @@
+# storage.py - Size-aware message bodies: short ones inline, long ones compressed
+
+import zlib
+
+from flask import current_app
+
+DEFAULT_COMPRESS_ABOVE = 4096        # bytes of UTF-8 before a body is compressed
+DEFAULT_PREVIEW_CHARS = 1000         # characters kept in `text` for polls and search
+DEFAULT_MAX_MESSAGE_BYTES = 262144   # larger messages are refused
+
+
+def _config(name, default):
+    return int(current_app.config.get(f"SUPPORT_CHAT_{name}", default))
+
+
+def max_message_bytes():
+    return _config("MAX_MESSAGE_BYTES", DEFAULT_MAX_MESSAGE_BYTES)
+
+
+def too_long(text):
+    """True if `text` is over the configured maximum size"""
+    return len(text.encode("utf-8")) > max_message_bytes()
+
+
+def message_fields(text):
+    """Column values for storing `text`.
+
+    Short messages keep the full text in `text`. Long ones keep only a preview
+    there and the whole message zlib-compressed in `body`, so polls, search
+    indexes and the FTS triggers only ever see the preview.
+    """
+    raw = text.encode("utf-8")
+    if len(raw) <= _config("COMPRESS_ABOVE", DEFAULT_COMPRESS_ABOVE):
+        return {"text": text, "body": None, "full_length": None}
+    return {
+        "text": text[:_config("PREVIEW_CHARS", DEFAULT_PREVIEW_CHARS)],
+        "body": zlib.compress(raw, 6),
+        "full_length": len(text),
+    }
+
+
+def full_text(text, body):
+    """The complete message from its stored preview and (optional) compressed body"""
+    if body is None:
+        return text
+    return zlib.decompress(body).decode("utf-8")
@@ -0,0 +1,46 @@
+# upsert.py - Dialect-specific INSERT ... ON CONFLICT statements
+
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from CTFd.models import db
+
+
+def _dialect(model):
+    # The session itself, not the scoped proxy (see binds.chat_dialect)
+    return db.session().get_bind(mapper=model.__mapper__).dialect.name
+
+
+def insert_ignore(model, values, conflict_cols):
+    """INSERT that does nothing if a row with the same unique key exists.
+
+    `values` is one row (dict) or several (list of dicts, one multi-row INSERT).
+    """
+    table = model.__table__
+    name = _dialect(model)
+    if name == "sqlite":
+        return sqlite.insert(table).values(values).on_conflict_do_nothing(index_elements=conflict_cols)
+    if name == "postgresql":
+        return postgresql.insert(table).values(values).on_conflict_do_nothing(index_elements=conflict_cols)
+    if name == "mysql":
+        return mysql.insert(table).values(values).prefix_with("IGNORE")
+    raise NotImplementedError(f"No insert-ignore for dialect {name}")
+
+
+def upsert(model, values, conflict_cols, update):
+    """INSERT `values`, or apply `update` to the existing row on a unique conflict.
+
+    `update` maps column names to values or expressions over the existing row,
+    e.g. {"unread_admin_count": UserNotification.unread_admin_count + 1}.
+    `values` may be a list of rows for a multi-row upsert.
+    """
+    table = model.__table__
+    name = _dialect(model)
+    if name == "sqlite":
+        stmt = sqlite.insert(table).values(values)
+        return stmt.on_conflict_do_update(index_elements=conflict_cols, set_=update)
+    if name == "postgresql":
+        stmt = postgresql.insert(table).values(values)
+        return stmt.on_conflict_do_update(index_elements=conflict_cols, set_=update)
+    if name == "mysql":
+        return mysql.insert(table).values(values).on_duplicate_key_update(**update)
+    raise NotImplementedError(f"No upsert for dialect {name}")
@@ -0,0 +1,214 @@
+# conftest.py - CTFd app fixture, seeded at several scales, and a statement counter
+
+import importlib
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tickets, messages and users seeded per run; every budget must hold at each
+SCALES = [10, 1_000, 10_000]
+
+ADMIN_NAME = "admin"
+PLAYER_NAME = "player"
+PASSWORD = "password"
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __str__(self):
+        return f"{self.count} statements:\n  " + "\n  ".join(self.statements)
+
+
+@contextmanager
+def count_queries():
+    """Count every cursor execution on any engine inside the block"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    counter = StatementCounter()
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.count += 1
+        counter.statements.append(" ".join(statement.split())[:200])
+
+    event.listen(Engine, "before_cursor_execute", on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, "before_cursor_execute", on_execute)
+
+
+def _create_app(ratelimit_db):
+    from CTFd import create_app
+    from CTFd.config import TestingConfig
+
+    class Config(TestingConfig):
+        SUPPORT_CHAT_QUERY_BUDGET = "strict"
+        SUPPORT_CHAT_RATELIMIT_DB = ratelimit_db
+        SUPPORT_CHAT_MESSAGE_BURST = 10_000
+        SUPPORT_CHAT_MESSAGES_PER_MINUTE = 10_000
+
+    app = create_app(Config)
+    if "support_chat" not in app.blueprints:
+        # Not installed under CTFd/plugins: load this checkout instead
+        sys.path.insert(0, ROOT)
+        importlib.import_module("support_chat").load(app)
+    return app
+
+
+def _setup_ctf(app):
+    """Same steps as CTFd's own test helper: run /setup, which creates the admin"""
+    with app.app_context():
+        with app.test_client() as client:
+            client.get("/setup")
+            with client.session_transaction() as sess:
+                data = {
+                    "ctf_name": "CTFd",
+                    "ctf_description": "Support chat query budgets",
+                    "name": ADMIN_NAME,
+                    "email": "admin@examplectf.com",
+                    "password": PASSWORD,
+                    "user_mode": "users",
+                    "nonce": sess.get("nonce"),
+                }
+            client.post("/setup", data=data)
+
+
+def _login(app, name):
+    client = app.test_client()
+    client.get("/login")
+    with client.session_transaction() as sess:
+        data = {"name": name, "password": PASSWORD, "nonce": sess.get("nonce")}
+    client.post("/login", data=data)
+    return client
+
+
+def _seed(chat, scale):
+    """`scale` users with one open ticket each, a team holding a tenth of them, and a
+    player whose own thread has `scale` messages"""
+    from CTFd.models import db, Users, Teams
+
+    models = chat.module("models")
+    now = datetime.utcnow()
+    admin_id = db.session.query(Users.id).filter(Users.name == ADMIN_NAME).scalar()
+
+    player = Users(name=PLAYER_NAME, email="player@examplectf.com", password=PASSWORD)
+    team = Teams(name="budget-team", email="team@examplectf.com")
+    db.session.add_all([player, team])
+    db.session.commit()
+
+    db.session.execute(Users.__table__.insert(), [
+        {
+            "name": f"user{i}",
+            "email": f"user{i}@examplectf.com",
+            "password": "x",
+            "type": "user",
+            "team_id": team.id if i % 10 == 0 else None,
+        }
+        for i in range(scale)
+    ])
+    user_ids = [row[0] for row in db.session.query(Users.id).filter(Users.name.like("user%")).all()]
+
+    db.session.execute(models.SupportTicket.__table__.insert(), [
+        {"user_id": uid, "open_user_id": uid, "status": "open", "created": now, "updated": now,
+         "pending_user_messages": 1}
+        for uid in user_ids + [player.id]
+    ])
+    tickets = dict(db.session.query(models.SupportTicket.user_id, models.SupportTicket.id).all())
+
+    messages = [
+        {"ticket_id": tickets[uid], "sender_role": "user", "sender_id": uid,
+         "text": f"Is there a hint for challenge {i}?", "created": now}
+        for i, uid in enumerate(user_ids)
+    ]
+    messages += [
+        {"ticket_id": tickets[player.id], "sender_role": "admin" if i % 2 else "user",
+         "sender_id": admin_id if i % 2 else player.id, "text": f"Thread message {i}, no hint yet",
+         "created": now - timedelta(seconds=scale - i)}
+        for i in range(scale)
+    ]
+    db.session.execute(models.SupportMessage.__table__.insert(), messages)
+
+    chat.module("bulk").refresh_summaries([])
+    db.session.commit()
+    chat.module("stats").rebuild_counters()
+
+    chat.ids = {
+        "ticket_id": tickets[player.id],
+        "message_id": db.session.query(db.func.max(models.SupportMessage.id))
+        .filter(models.SupportMessage.ticket_id == tickets[player.id]).scalar(),
+        "team_id": team.id,
+        "admin_id": admin_id,
+    }
+    chat.user_ids = user_ids
+
+
+class Chat:
+    """A seeded CTFd app with logged-in player and admin clients"""
+
+    def __init__(self, app, scale):
+        self.app = app
+        self.scale = scale
+        self.package = app.blueprints["support_chat"].import_name
+        self.plugin = importlib.import_module(self.package)
+        self.querybudget = self.module("querybudget")
+        self.clients = {}
+        self.ids = {}
+        self.user_ids = []
+
+    def module(self, name):
+        """A plugin submodule, from whichever copy of the plugin the app loaded"""
+        return importlib.import_module(f"{self.package}.{name}")
+
+    count_queries = staticmethod(count_queries)
+
+    def post(self, client, url, data):
+        with client.session_transaction() as sess:
+            nonce = sess.get("nonce")
+        return client.post(url, data={**data, "nonce": nonce})
+
+    def login(self):
+        self.clients = {"player": _login(self.app, PLAYER_NAME), "admin": _login(self.app, ADMIN_NAME)}
+
+    def clear_cache(self):
+        """Empty CTFd's cache, so the plugin's cached lookups miss on the next request.
+
+        CTFd keeps server-side sessions in that cache too, so both clients log in again.
+        """
+        from CTFd.cache import cache
+
+        with self.app.app_context():
+            cache.clear()
+        self.login()
+
+    def user_count(self):
+        from CTFd.models import Users
+
+        with self.app.app_context():
+            return Users.query.count()
+
+
+@pytest.fixture(scope="module", params=SCALES, ids=lambda n: f"{n}-rows")
+def chat(request, tmp_path_factory):
+    app = _create_app(str(tmp_path_factory.mktemp("ratelimit") / "buckets.sqlite3"))
+    _setup_ctf(app)
+
+    chat = Chat(app, request.param)
+    with app.app_context():
+        _seed(chat, request.param)
+    chat.login()
+    yield chat
+
+    from CTFd.models import db
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
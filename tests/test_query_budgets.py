@@ -0,0 +1,85 @@
+# test_query_budgets.py - Every budgeted route, and every broadcast target, at 10 to 10,000 rows
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("CTFd")
+
+# endpoint, client, method, url, form data; {placeholders} come from Chat.ids
+ROUTES = [
+    ("support_chat.get_or_create_ticket", "player", "GET", "/support/ticket?compact=1", None),
+    ("support_chat.get_unread_count", "player", "GET", "/support/unread_count", None),
+    ("support_chat.mark_messages_read", "player", "POST", "/support/mark_read", {}),
+    ("support_chat.post_user_message", "player", "POST", "/support/message", {"text": "Budget check {scale}"}),
+    ("support_chat.get_full_message", "player", "GET", "/support/message/{message_id}/full", None),
+    ("support_chat.support_admin_home", "admin", "GET", "/support/admin", None),
+    ("support_chat.support_admin_ticket", "admin", "GET", "/support/admin/ticket/{ticket_id}?compact=1", None),
+    ("support_chat.support_admin_reply", "admin", "POST", "/support/admin/reply",
+     {"ticket_id": "{ticket_id}", "text": "Admin budget check {scale}"}),
+    ("support_chat.support_admin_stats", "admin", "GET", "/support/admin/stats", None),
+    ("support_chat.support_admin_search", "admin", "GET", "/support/admin/search?q=hint&compact=1", None),
+]
+
+
+def test_every_budget_is_tested(chat):
+    assert {route[0] for route in ROUTES} == set(chat.querybudget.ROUTE_BUDGETS)
+
+
+@pytest.mark.parametrize(
+    "endpoint, who, method, url, data", ROUTES, ids=[route[0].split(".")[1] for route in ROUTES]
+)
+def test_route_within_budget(chat, endpoint, who, method, url, data):
+    values = {**chat.ids, "scale": chat.scale}
+    url = url.format(**values)
+    chat.clear_cache()  # measure the uncached path
+    client = chat.clients[who]
+
+    if method == "GET":
+        r = client.get(url)
+    else:
+        r = chat.post(client, url, {k: str(v).format(**values) for k, v in (data or {}).items()})
+
+    assert r.status_code == 200, r.get_data(as_text=True)[:500]
+    # Set by querybudget on counted routes; strict mode has already raised if over
+    count = int(r.headers["X-Support-Chat-Queries"])
+    budget = chat.querybudget.ROUTE_BUDGETS[endpoint]
+    assert count <= budget, f"{endpoint} ran {count} statements with {chat.scale} rows (budget {budget})"
+
+
+@pytest.mark.parametrize("target", ["all", "open_tickets", "specific_team"])
+def test_broadcast_within_budget(chat, target):
+    data = {"message": f"Budget broadcast {chat.scale}", "target": target}
+    if target == "specific_team":
+        data["team_id"] = chat.ids["team_id"]
+    recipients = chat.user_count()  # an upper bound for every target
+
+    with chat.count_queries() as counter:
+        r = chat.post(chat.clients["admin"], "/support/admin/broadcast", data)
+
+    body = r.get_json()
+    assert r.status_code == 200 and body["ok"], body
+    # Strict mode rolls back a batch over BROADCAST_BATCH_BUDGET and lists it under errors
+    assert not body.get("errors"), body["errors"]
+    if target == "open_tickets":
+        assert body["tickets_created"] == 0, body  # never opens tickets
+    budget = chat.querybudget.broadcast_budget(recipients, chat.plugin.BROADCAST_BATCH_SIZE)
+    assert counter.count <= budget, f"broadcast to {target} with {chat.scale} rows ran {counter}"
+
+
+@pytest.mark.parametrize("size", [1, 10, 100])
+def test_broadcast_batch_is_constant(chat, size):
+    from CTFd.models import db
+
+    bulk = chat.module("bulk")
+    SupportTicket = chat.module("models").SupportTicket
+    user_ids = chat.user_ids[:size]
+    with chat.app.app_context():
+        # Half the batch keeps its open ticket, the other half needs one opened
+        bulk.set_status([SupportTicket.user_id.in_(user_ids[size // 2:])], "closed")
+        with chat.count_queries() as counter:
+            bulk.broadcast_batch(user_ids, "Batch budget check", chat.ids["admin_id"], datetime.utcnow())
+        db.session.rollback()
+
+    budget = chat.querybudget.BROADCAST_BATCH_BUDGET
+    assert counter.count <= budget, f"batch of {size} with {chat.scale} rows ran {counter}"
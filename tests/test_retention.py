@@ -0,0 +1,44 @@
+# test_retention.py - Broadcast compaction archives closed broadcast-only tickets and nothing else
+
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("CTFd")
+
+
+@pytest.mark.parametrize("chat", [10], indirect=True, ids=["10-rows"])
+def test_compaction_only_archives_closed_broadcast_only_tickets(chat):
+    from CTFd.models import db
+
+    models = chat.module("models")
+    bulk = chat.module("bulk")
+    SupportTicket, SupportMessage = models.SupportTicket, models.SupportMessage
+    closed_broadcast, open_broadcast, closed_conversation = (
+        chat.user_ids[:3], chat.user_ids[3:6], chat.user_ids[6:7]
+    )
+    old = datetime.utcnow() - timedelta(days=10)
+
+    with chat.app.app_context():
+        broadcast_only = closed_broadcast + open_broadcast
+        SupportMessage.query.filter(SupportMessage.ticket_id.in_(
+            db.session.query(SupportTicket.id).filter(SupportTicket.user_id.in_(broadcast_only))
+        )).delete(synchronize_session=False)
+        bulk.broadcast_batch(broadcast_only, "[BROADCAST] Old news", chat.ids["admin_id"], old)
+        bulk.set_status([SupportTicket.user_id.in_(closed_broadcast + closed_conversation)], "closed")
+        SupportTicket.query.update({"updated": old}, synchronize_session=False)
+        db.session.commit()
+
+        result = chat.module("retention").run_retention(archive_after_days=30, broadcast_after_days=7)
+
+        live = dict(db.session.query(SupportTicket.user_id, SupportTicket.status).all())
+        archived = {row.user_id for row in models.SupportTicketArchive.query.all()}
+        archived_texts = {row.text for row in models.SupportMessageArchive.query.all()}
+        counters = dict(db.session.query(models.SupportCounter.name, models.SupportCounter.value).all())
+        rebuilt = chat.module("stats").rebuild_counters()
+
+    assert result == {"archived_tickets": 0, "archived_broadcast_tickets": len(closed_broadcast)}
+    assert archived == set(closed_broadcast) and archived_texts == {"[BROADCAST] Old news"}
+    assert all(live[uid] == "open" for uid in open_broadcast)
+    assert all(live[uid] == "closed" for uid in closed_conversation)
+    assert counters == rebuilt
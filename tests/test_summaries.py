@@ -0,0 +1,28 @@
+# test_summaries.py - Summary backfills recount threads without touching their activity times
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("CTFd")
+
+
+@pytest.mark.parametrize("chat", [10], indirect=True, ids=["10-rows"])
+def test_refresh_summaries_keeps_updated(chat):
+    from CTFd.models import db
+
+    SupportTicket = chat.module("models").SupportTicket
+    ticket_id = chat.ids["ticket_id"]
+    last_activity = datetime(2020, 1, 1, 12, 0, 0)
+
+    with chat.app.app_context():
+        # Stale counts, as on an install that predates the summary columns
+        SupportTicket.query.update({"message_count": 0, "updated": last_activity}, synchronize_session=False)
+        db.session.commit()
+
+        chat.module("bulk").refresh_summaries([])
+        db.session.commit()
+
+        rows = db.session.query(SupportTicket.id, SupportTicket.updated, SupportTicket.message_count).all()
+        assert {updated for _, updated, _ in rows} == {last_activity}
+        assert dict((id_, count) for id_, _, count in rows)[ticket_id] == chat.scale